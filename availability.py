@@ -0,0 +1,39 @@
+import store
+from store import BOOKS_FILE
+
+
+# Function to create empty counters: total books and the available ones, in the order they became available
+def _create():
+    return {"total": 0, "available": {}}
+
+
+# Function to count a book in
+def _add(index, book):
+    index["total"] += 1
+    if book.get("available"):
+        index["available"][id(book)] = book
+
+
+# Function to count a book out
+def _remove(index, book):
+    index["total"] -= 1
+    index["available"].pop(id(book), None)
+
+
+store.register_index("availability", BOOKS_FILE, _create, _add, _remove, fields=("available",))
+
+
+# Function to get the total, available and unavailable book counts
+def summary():
+    index = store.derived_index("availability")
+    total_books = index["total"]
+    total_available_books = len(index["available"])
+    return total_books, total_available_books, total_books - total_available_books
+
+
+# Function to iterate over the available books
+def available_books():
+    if not store.is_loaded(BOOKS_FILE):
+        # Stream the catalog rather than loading it just to list what is on the shelf
+        return (book for book in store.iter_records(BOOKS_FILE) if book["available"])
+    return iter(store.derived_index("availability")["available"].values())
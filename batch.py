@@ -0,0 +1,206 @@
+import argparse
+import csv
+import json
+import time
+from datetime import datetime
+
+import history
+import limits
+import reservation_queue
+import store
+from records import Book, Borrow, Member, Reservation
+from store import BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE
+
+
+# Function to read a required integer field of a batch row
+def _int_field(row, field):
+    value = row.get(field)
+    if value is None or value == "":
+        raise ValueError(f"Missing {field}.")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field}: {value!r}.")
+
+
+# Function to read an optional true/false field of a batch row
+def _bool_field(row, field, default):
+    value = row.get(field)
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() == "true"
+
+
+# Function to copy the given text fields of a batch row that are present
+def _text_fields(row, fields):
+    return {field: row[field] for field in fields if row.get(field) not in (None, "")}
+
+
+# Function to borrow a book for a member
+def _borrow(row):
+    book_id, member_id = _int_field(row, "book_id"), _int_field(row, "member_id")
+    book = store.get(BOOKS_FILE, book_id)
+    if book is None:
+        raise ValueError("Book not found.")
+    if not store.exists(MEMBERS_FILE, member_id):
+        raise ValueError("Member not found.")
+    if not book["available"]:
+        raise ValueError("Book is currently unavailable.")
+    reason = limits.check_loan(member_id)
+    if reason:
+        raise ValueError(reason)
+    store.update(BOOKS_FILE, book_id, {"available": False})
+    store.insert(BORROWS_FILE, Borrow(book_id=book_id, member_id=member_id, borrowed_at=history.now()))
+
+
+# Function to receive a returned book
+def _return(row):
+    book_id = _int_field(row, "book_id")
+    if store.update(BOOKS_FILE, book_id, {"available": True}) is None:
+        raise ValueError("Book not found.")
+    history.archive(store.delete_where(BORROWS_FILE, "book_id", book_id))
+    reservation_queue.fulfill_next(book_id)
+
+
+# Function to make a reservation
+def _reserve(row):
+    book_id, member_id = _int_field(row, "book_id"), _int_field(row, "member_id")
+    if not store.exists(BOOKS_FILE, book_id):
+        raise ValueError("Book not found.")
+    if not store.exists(MEMBERS_FILE, member_id):
+        raise ValueError("Member not found.")
+    if store.exists(RESERVATIONS_FILE, (book_id, member_id)):
+        raise ValueError("Reservation already made.")
+    reason = limits.check_reservation(member_id)
+    if reason:
+        raise ValueError(reason)
+    store.insert(RESERVATIONS_FILE, Reservation(book_id=book_id, member_id=member_id,
+                                             reserved_at=datetime.now().isoformat(timespec="seconds")))
+
+
+# Function to create a book record
+def _create_book(row):
+    book_info = _text_fields(row, ("title", "author"))
+    if "title" not in book_info:
+        raise ValueError("Missing title.")
+    book_info.setdefault("author", "")
+    book_info["available"] = _bool_field(row, "available", True)
+    book_info["id"] = store.next_id(BOOKS_FILE)  # Assign a unique ID
+    store.insert(BOOKS_FILE, Book(book_info))
+
+
+# Function to update a book record
+def _update_book(row):
+    book_info = _text_fields(row, ("title", "author"))
+    if row.get("available") not in (None, ""):
+        book_info["available"] = _bool_field(row, "available", True)
+    if store.update(BOOKS_FILE, _int_field(row, "book_id"), book_info) is None:
+        raise ValueError("Book not found.")
+
+
+# Function to delete a book record
+def _delete_book(row):
+    if store.delete(BOOKS_FILE, _int_field(row, "book_id")) is None:
+        raise ValueError("Book not found.")
+
+
+# Function to create a member profile
+def _create_member(row):
+    member_info = _text_fields(row, ("name", "email"))
+    if "name" not in member_info:
+        raise ValueError("Missing name.")
+    member_info.setdefault("email", "")
+    member_info["id"] = store.next_id(MEMBERS_FILE)  # Assign a unique ID
+    store.insert(MEMBERS_FILE, Member(member_info))
+
+
+# Function to update a member profile
+def _update_member(row):
+    member_info = _text_fields(row, ("name", "email"))
+    if store.update(MEMBERS_FILE, _int_field(row, "member_id"), member_info) is None:
+        raise ValueError("Member not found.")
+
+
+# Function to delete a member profile
+def _delete_member(row):
+    if store.delete(MEMBERS_FILE, _int_field(row, "member_id")) is None:
+        raise ValueError("Member not found.")
+
+
+# Batch operations by the name used in the "op" column
+OPERATIONS = {
+    "borrow": _borrow,
+    "return": _return,
+    "reserve": _reserve,
+    "create_book": _create_book,
+    "update_book": _update_book,
+    "delete_book": _delete_book,
+    "create_member": _create_member,
+    "update_member": _update_member,
+    "delete_member": _delete_member,
+}
+
+
+# Function to read batch rows from a CSV file with a header line, a JSONL file with one object per line, or a
+# JSON file holding an array of objects; JSONL lines are left undecoded so a bad one only fails its own row
+def read_rows(path):
+    with open(path, "r", newline="") as file:
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield line
+        elif path.endswith(".json"):
+            yield from json.load(file)
+        else:
+            yield from csv.DictReader(file)
+
+
+# Function to turn a row read by read_rows into a dict, raising ValueError if it is not a JSON object
+def parse_row(row):
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"Row is not an object: {row!r}.")
+    return row
+
+
+# Function to apply batch rows in one transaction, returning the applied count and (row number, error) pairs;
+# a failed row leaves no trace of what it changed before failing
+def apply_batch(rows):
+    applied = 0
+    errors = []
+    with store.transaction():
+        for number, row in enumerate(rows, start=1):
+            try:
+                row = parse_row(row)
+                operation = OPERATIONS.get(str(row.get("op", "")).strip().lower())
+                if operation is None:
+                    raise ValueError(f"Unknown operation: {row.get('op')!r}.")
+                with store.savepoint():
+                    operation(row)
+                applied += 1
+            except ValueError as error:
+                errors.append((number, str(error)))
+    return applied, errors
+
+
+# Main function for batch mode
+def batch_main():
+    parser = argparse.ArgumentParser(
+        description="Apply a batch of circulation and catalog operations without the interactive menu.")
+    parser.add_argument("file", help="CSV (with header), JSONL or JSON array file of operations: "
+                                     "op, book_id, member_id, title, author, available, name, email")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    applied, errors = apply_batch(read_rows(args.file))
+    elapsed = time.perf_counter() - start
+    for number, message in errors:
+        print(f"Row {number}: {message}")
+    print(f"Applied {applied} of {applied + len(errors)} operations in {elapsed:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    batch_main()
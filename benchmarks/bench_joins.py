@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from benchmarks import synthetic
+
+
+# Function to list borrowed books the way staff.py did before the hash joins (baseline only)
+def legacy_list_borrowed_books(borrows, books, members):
+    rows = []
+    for borrow in borrows:
+        for book in books:
+            if book["id"] == borrow["book_id"]:
+                for member in members:
+                    if member["id"] == borrow["member_id"]:
+                        rows.append((book["id"], member["id"]))
+                        break
+                break
+    return rows
+
+
+# Function to list reserved books the way staff.py did before the hash joins (baseline only)
+def legacy_list_all_reservation_books(reservations, books):
+    rows = []
+    for reservation in reservations:
+        for book in books:
+            if book["id"] == reservation["book_id"]:
+                rows.append(book)
+                break
+    return rows
+
+
+# Function to list a member's borrowed books the way customer.py did before the hash joins (baseline only)
+def legacy_list_borrowed_books_by_member(borrows, books, member_id):
+    rows = []
+    for borrow in borrows:
+        if borrow["member_id"] == member_id:
+            for book in books:
+                if book["id"] == borrow["book_id"]:
+                    rows.append(book)
+                    break
+    return rows
+
+
+# Function to time a call, in seconds
+def timed(function, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(*args)
+    return time.perf_counter() - start
+
+
+# Function to time a legacy join on a sample of the outer rows and scale it to the full size
+def timed_legacy(function, outer, sample, *args):
+    sample_rows = outer[:sample]
+    seconds = timed(function, sample_rows, *args)
+    return seconds * len(outer) / max(len(sample_rows), 1)
+
+
+# Main function for the benchmark
+def main():
+    parser = argparse.ArgumentParser(description="Compare the hash-join reports with the old nested-loop scans.")
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument("--borrows", type=int, default=20000)
+    parser.add_argument("--reservations", type=int, default=20000)
+    parser.add_argument("--legacy-sample", type=int, default=200,
+                        help="outer rows run through the nested loops, the time is extrapolated to all rows")
+    args = parser.parse_args()
+
+    # The applications work on .dat files in the current directory, so run them in a scratch one
+    os.chdir(tempfile.mkdtemp(prefix="lms-bench-"))
+    library = synthetic.generate_library(args.books, args.members, args.borrows, args.reservations)
+    synthetic.write_library(".", library)
+    books, members = library["Books.dat"], library["Members.dat"]
+    borrows, reservations = library["Borrows.dat"], library["Reservations.dat"]
+    member_id = borrows[0]["member_id"] if borrows else 1
+
+    import customer
+    import staff
+
+    # Load every collection once so both sides are timed on data already in memory
+    for file_name in library:
+        staff.read_data(file_name)
+
+    results = [
+        ("list_borrowed_books",
+         timed_legacy(legacy_list_borrowed_books, borrows, args.legacy_sample, books, members),
+         timed(staff.list_borrowed_books)),
+        ("list_all_reservation_books",
+         timed_legacy(legacy_list_all_reservation_books, reservations, args.legacy_sample, books),
+         timed(staff.list_all_reservation_books)),
+        ("list_borrowed_books_by_member",
+         timed(legacy_list_borrowed_books_by_member, borrows, books, member_id),
+         timed(customer.list_borrowed_books_by_member, member_id)),
+    ]
+
+    print(f"{args.books} books, {args.members} members, {len(borrows)} borrows, {len(reservations)} reservations")
+    print("{:<32} {:>14} {:>14} {:>10}".format("Report", "Nested loops", "Hash join", "Speedup"))
+    for name, legacy_seconds, new_seconds in results:
+        print("{:<32} {:>13.3f}s {:>13.3f}s {:>9.0f}x".format(
+            name, legacy_seconds, new_seconds, legacy_seconds / max(new_seconds, 1e-9)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import synthetic
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Function to answer the interactive prompts: skip the reservation queue, decline reservations
+def _scripted_input(prompt=""):
+    return "0" if "book ID" in prompt else "no"
+
+
+# Function to get the value below which the given fraction of the sorted samples fall
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+# Function to build the benchmarked operations as (name, repeats, call taking a random generator)
+def operations(staff, sizes, repeat, report_repeat):
+    books, members = sizes["books"], sizes["members"]
+    return [
+        ("search_books", repeat,
+         lambda rng: staff.search_books(rng.choice(synthetic.WORDS))),
+        ("borrow_or_reserve_book", repeat,
+         lambda rng: staff.borrow_or_reserve_book(rng.randint(1, books), rng.randint(1, members))),
+        ("receive_returned_book", repeat,
+         lambda rng: staff.receive_returned_book(rng.randint(1, books))),
+        ("list_borrowed_books", report_repeat,
+         lambda rng: staff.list_borrowed_books()),
+        ("book_summary", repeat,
+         lambda rng: staff.book_summary()),
+        ("manage_books", repeat,
+         lambda rng: staff.manage_books(*rng.choice([
+             ("create", {"title": "benchmark title", "author": "benchmark author", "available": True}),
+             ("read", {"id": rng.randint(1, books)}),
+             ("update", {"id": rng.randint(1, books), "title": "updated title"}),
+         ]))),
+        ("manage_members", repeat,
+         lambda rng: staff.manage_members(*rng.choice([
+             ("create", {"name": "benchmark member", "email": "bench@example.com"}),
+             ("read", {"id": rng.randint(1, members)}),
+             ("update", {"id": rng.randint(1, members), "email": "updated@example.com"}),
+         ]))),
+    ]
+
+
+# Function to time every operation on a freshly generated library of the given number of books
+def run_size(books, args):
+    os.chdir(tempfile.mkdtemp(prefix=f"lms-bench-{books}-"))
+    sizes = synthetic.library_sizes(books)
+    synthetic.write_library(".", synthetic.generate_library(seed=args.seed, **sizes))
+
+    # Imported only now, as the store sets up its data files in the current directory
+    import store
+    import json_backend
+    import result_cache
+    import staff
+
+    json_backend.SYNC_WRITES = not args.no_sync
+    # Time the operations themselves, repeated searches over the small vocabulary would be cache hits
+    result_cache.RESULT_CACHE_SIZE = 0
+    if args.backend == "sqlite":
+        import migrate
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            migrate.migrate_to_sqlite()
+    store.use_backend(args.backend)
+
+    results = []
+    rng = random.Random(args.seed)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for file_name in store.COLLECTIONS:
+            store.load(file_name)
+        results.append({"books": books, "operation": "load", "calls": 1,
+                        "p50_ms": (time.perf_counter() - start) * 1000, "p95_ms": None, "p99_ms": None,
+                        "peak_kib": None})
+
+        for name, repeats, call in operations(staff, sizes, args.repeat, args.report_repeat):
+            # The first call builds any index the operation relies on, keep it out of the samples
+            call(rng)
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                call(rng)
+                samples.append((time.perf_counter() - start) * 1000)
+
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call(rng)
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+            tracemalloc.stop()
+
+            results.append({"books": books, "operation": name, "calls": repeats,
+                            "p50_ms": percentile(samples, 0.50), "p95_ms": percentile(samples, 0.95),
+                            "p99_ms": percentile(samples, 0.99), "peak_kib": peak / 1024})
+    return results
+
+
+# Function to format an optional number for the results table
+def _cell(value, width, digits):
+    return f"{value:>{width}.{digits}f}" if value is not None else f"{'-':>{width}}"
+
+
+# Main function for the benchmark suite
+def main():
+    parser = argparse.ArgumentParser(description="Time the LMS operations on synthetic libraries of growing size.")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated numbers of books, members/borrows/reservations scale with them")
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per operation")
+    parser.add_argument("--report-repeat", type=int, default=5, help="timed calls per full report")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--no-sync", action="store_true", help="skip fsync on JSON writes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+
+    builtins.input = _scripted_input
+    results = []
+    print("{:>8} {:<24} {:>6} {:>10} {:>10} {:>10} {:>12}".format(
+        "Books", "Operation", "Calls", "p50 ms", "p95 ms", "p99 ms", "Peak KiB"))
+    for books in (int(size) for size in args.sizes.split(",")):
+        for result in run_size(books, args):
+            results.append(result)
+            print("{:>8} {:<24} {:>6} {} {} {} {}".format(
+                result["books"], result["operation"], result["calls"], _cell(result["p50_ms"], 10, 3),
+                _cell(result["p95_ms"], 10, 3), _cell(result["p99_ms"], 10, 3), _cell(result["peak_kib"], 12, 1)))
+    if resource is not None:
+        print(f"Peak resident memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss} KiB")
+
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
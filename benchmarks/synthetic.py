@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import random
+
+# Words used to build synthetic titles, author and member names
+WORDS = [
+    "love", "story", "heavens", "door", "river", "stone", "night", "garden", "light", "shadow",
+    "war", "peace", "city", "winter", "summer", "silent", "golden", "lost", "hidden", "last",
+    "empire", "dream", "ocean", "mountain", "secret", "journey", "fire", "glass", "house", "road",
+]
+NAMES = [
+    "saroj", "santos", "hero", "ram", "sita", "hari", "gita", "krishna", "maya", "bikash",
+    "anita", "rajesh", "sunita", "deepak", "priya", "arjun", "nisha", "rohan", "kiran", "asha",
+]
+
+
+# Function to generate a synthetic library as a dict of collection file name -> records
+def generate_library(books, members, borrows, reservations, seed=0):
+    rng = random.Random(seed)
+    book_records = [{
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))),
+        "author": f"{rng.choice(NAMES)} {rng.choice(NAMES)}",
+        "available": True,
+        "id": book_id,
+    } for book_id in range(1, books + 1)]
+    member_records = [{
+        "name": f"{rng.choice(NAMES)} {rng.choice(NAMES)}",
+        "email": f"member{member_id}@example.com",
+        "id": member_id,
+    } for member_id in range(1, members + 1)]
+
+    # Each borrowed book is lent to one member and marked unavailable
+    borrowed_ids = rng.sample(range(1, books + 1), min(borrows, books))
+    borrow_records = []
+    for book_id in borrowed_ids:
+        book_records[book_id - 1]["available"] = False
+        borrow_records.append({"book_id": book_id, "member_id": rng.randint(1, members)})
+
+    # Reservations queue up on books that are currently out
+    reservation_records = []
+    reserved = set()
+    reservations = min(reservations, len(borrowed_ids) * members)
+    while borrowed_ids and members and len(reservation_records) < reservations:
+        key = (rng.choice(borrowed_ids), rng.randint(1, members))
+        if key not in reserved:
+            reserved.add(key)
+            reservation_records.append({"book_id": key[0], "member_id": key[1]})
+
+    return {
+        "Books.dat": book_records,
+        "Members.dat": member_records,
+        "Borrows.dat": borrow_records,
+        "Reservations.dat": reservation_records,
+    }
+
+
+# Function to write a synthetic library as .dat files into a directory
+def write_library(directory, library):
+    for file_name, records in library.items():
+        with open(os.path.join(directory, file_name), "w") as file:
+            json.dump(records, file)
+
+
+# Function to work out the collection sizes of a library with the given number of books
+def library_sizes(books):
+    return {"books": books, "members": max(books // 2, 1), "borrows": books // 5, "reservations": books // 10}
+
+
+# Main function to write a synthetic dataset
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic library as Books/Members/Borrows/Reservations.dat.")
+    parser.add_argument("directory", help="directory to write the .dat files to")
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--members", type=int, help="default: half the number of books")
+    parser.add_argument("--borrows", type=int, help="default: a fifth of the number of books")
+    parser.add_argument("--reservations", type=int, help="default: a tenth of the number of books")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = library_sizes(args.books)
+    for name in ("members", "borrows", "reservations"):
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    os.makedirs(args.directory, exist_ok=True)
+    write_library(args.directory, generate_library(seed=args.seed, **sizes))
+    print("Wrote {books} books, {members} members, {borrows} borrows and {reservations} reservations "
+          "to {directory}.".format(directory=args.directory, **sizes))
+
+
+if __name__ == "__main__":
+    main()
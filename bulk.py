@@ -0,0 +1,147 @@
+import argparse
+import csv
+import json
+import re
+import time
+
+import batch
+import records
+import store
+from records import Book
+from store import BOOKS_FILE, BORROWS_FILE, MEMBERS_FILE
+
+# Characters dropped from an ISBN before comparing, such as dashes and spaces
+ISBN_SEPARATORS = re.compile(r"[^0-9A-Za-z]")
+
+# Collections that can be exported, and the CSV columns written for each
+EXPORTS = {
+    "books": (BOOKS_FILE, ("id", "title", "author", "available", "isbn")),
+    "members": (MEMBERS_FILE, ("id", "name", "email")),
+    "borrows": (BORROWS_FILE, ("book_id", "member_id", "borrowed_at")),
+}
+
+
+# Function to normalize an ISBN so the same number written with or without dashes matches
+def _normalize_isbn(isbn):
+    return ISBN_SEPARATORS.sub("", str(isbn)).upper()
+
+
+# Function to get the key a book is deduplicated by: its ISBN if it has one, otherwise its title and author
+def dedupe_key(book):
+    isbn = _normalize_isbn(book["isbn"]) if book.get("isbn") else ""
+    if isbn:
+        return "isbn", isbn
+    return "title", str(book.get("title", "")).strip().casefold(), str(book.get("author", "")).strip().casefold()
+
+
+# Function to turn an import row into a book without an ID, raising ValueError if it is not valid
+def _book_from_row(row):
+    title = str(row.get("title") or "").strip()
+    if not title:
+        raise ValueError("Missing title.")
+    book = Book(title=title, author=str(row.get("author") or "").strip())
+    available = row.get("available")
+    if isinstance(available, bool):
+        book["available"] = available
+    elif available in (None, ""):
+        book["available"] = True
+    elif str(available).strip().lower() in ("true", "false"):
+        book["available"] = str(available).strip().lower() == "true"
+    else:
+        raise ValueError(f"Invalid available: {available!r}.")
+    isbn = row.get("isbn")
+    if isbn:
+        isbn = _normalize_isbn(isbn)
+        if len(isbn) not in (10, 13):
+            raise ValueError(f"Invalid isbn: {row['isbn']!r}.")
+        book["isbn"] = isbn
+    return book
+
+
+# Function to validate the rows of an import feed as they are read, returning the valid books and (row, error) pairs
+def read_books(rows):
+    books = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            books.append(_book_from_row(batch.parse_row(row)))
+        except ValueError as error:
+            errors.append((number, str(error)))
+    return books, errors
+
+
+# Function to add new books in one transaction, skipping those already in the catalog or earlier in the feed
+def import_books(books):
+    with store.transaction():
+        seen = {dedupe_key(book) for book in store.iter_records(BOOKS_FILE)}
+        new_books = []
+        for book in books:
+            key = dedupe_key(book)
+            if key not in seen:
+                seen.add(key)
+                new_books.append(book)
+        for book, book_id in zip(new_books, store.next_ids(BOOKS_FILE, len(new_books))):
+            book["id"] = book_id
+        store.insert_many(BOOKS_FILE, new_books)
+    return len(new_books), len(books) - len(new_books)
+
+
+# Function to stream the records of a collection to a CSV, JSONL or JSON array file, returning the number of rows
+def export_records(name, path):
+    file_name, columns = EXPORTS[name]
+    count = 0
+    with open(path, "w", newline="") as file:
+        if path.endswith(".jsonl"):
+            for record in store.iter_records(file_name):
+                file.write(json.dumps(record, default=records.to_json) + "\n")
+                count += 1
+        elif path.endswith(".json"):
+            file.write("[")
+            for record in store.iter_records(file_name):
+                file.write((",\n" if count else "\n") + json.dumps(record, default=records.to_json))
+                count += 1
+            file.write("\n]\n")
+        else:
+            writer = csv.DictWriter(file, columns, extrasaction="ignore")
+            writer.writeheader()
+            for record in store.iter_records(file_name):
+                writer.writerow(record)
+                count += 1
+    return count
+
+
+# Function to format a throughput figure
+def _rate(count, elapsed):
+    return f"{count / elapsed:,.0f} rows/sec" if elapsed > 0 else "n/a"
+
+
+# Main function for bulk import and export
+def bulk_main():
+    parser = argparse.ArgumentParser(
+        description="Import books from, or export collections to, CSV, JSONL or JSON files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="add books from a feed with title, author, available, isbn")
+    import_parser.add_argument("file")
+    export_parser = commands.add_parser("export", help="write a collection to a file")
+    export_parser.add_argument("collection", choices=sorted(EXPORTS))
+    export_parser.add_argument("file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "import":
+        books, errors = read_books(batch.read_rows(args.file))
+        imported, duplicates = import_books(books)
+        elapsed = time.perf_counter() - start
+        for number, message in errors:
+            print(f"Row {number}: {message}")
+        total = len(books) + len(errors)
+        print(f"Imported {imported} books, skipped {duplicates} duplicates and {len(errors)} invalid rows "
+              f"in {elapsed:.2f} seconds ({_rate(total, elapsed)}).")
+    else:
+        count = export_records(args.collection, args.file)
+        elapsed = time.perf_counter() - start
+        print(f"Exported {count} {args.collection} to {args.file} in {elapsed:.2f} seconds ({_rate(count, elapsed)}).")
+
+
+if __name__ == "__main__":
+    bulk_main()
@@ -0,0 +1,194 @@
+import argparse
+import array
+import bisect
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+from contextlib import contextmanager
+
+import store
+from store import BOOKS_FILE
+
+# Compact copy of the book catalog
+CATALOG_FILE = "Books.bin"
+
+# File header: magic, format version, flags, number of books, number of strings
+HEADER = struct.Struct("<4sHHII")
+MAGIC = b"LMSB"
+VERSION = 1
+
+# Flag set when the id column is in ascending order, so a book can be found by binary search
+SORTED_IDS = 1
+
+# Fields stored in their own column, any other field of a book goes to its JSON "extra" string
+COLUMN_FIELDS = ("id", "title", "author", "available")
+
+# Columns are stored little-endian, views are taken straight from the mapped file on little-endian machines
+NATIVE_ORDER = sys.byteorder == "little"
+
+
+# Function to round a file offset up to a multiple of the alignment
+def _align(offset, alignment=8):
+    return -(-offset // alignment) * alignment
+
+
+# Function to write books to a compact catalog file: id and availability columns plus a string table
+def write_catalog(books, path=CATALOG_FILE):
+    ids = array.array("q")
+    available = bytearray()
+    refs = {"title": array.array("I"), "author": array.array("I"), "extra": array.array("I")}
+    # String 0 is the empty string, every distinct title, author or extra is stored once
+    strings = {"": 0}
+    for book in books:
+        ids.append(book["id"])
+        available.append(1 if book["available"] else 0)
+        extra = {field: value for field, value in book.items() if field not in COLUMN_FIELDS}
+        for field, text in (("title", book.get("title", "")), ("author", book.get("author", "")),
+                            ("extra", json.dumps(extra) if extra else "")):
+            refs[field].append(strings.setdefault(str(text), len(strings)))
+
+    encoded = [text.encode() for text in strings]
+    offsets = array.array("I", itertools.accumulate(map(len, encoded), initial=0))
+    columns = [ids, refs["title"], refs["author"], refs["extra"], available, offsets]
+    if not NATIVE_ORDER:
+        for column in columns:
+            if isinstance(column, array.array):
+                column.byteswap()
+    flags = SORTED_IDS if all(a < b for a, b in zip(ids, itertools.islice(ids, 1, None))) else 0
+
+    temp_name = path + ".tmp"
+    with open(temp_name, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, flags, len(ids), len(encoded)))
+        for column in columns:
+            file.write(b"\0" * (_align(file.tell()) - file.tell()))
+            file.write(column)
+        file.write(b"".join(encoded))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_name, path)
+    return len(ids)
+
+
+# Function to take a typed column out of the mapped file, returning it and the offset after it
+def _column(view, offset, count, code):
+    offset = _align(offset)
+    size = count * struct.calcsize(code)
+    column = view[offset:offset + size].cast(code)
+    if not NATIVE_ORDER and code != "B":
+        swapped = array.array(code, column)
+        swapped.byteswap()
+        column.release()
+        column = swapped
+    return column, offset + size
+
+
+# Function to open a catalog file as memory-mapped columns, without building a dict per book
+@contextmanager
+def open_catalog(path=CATALOG_FILE):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        view = memoryview(data)
+        magic, version, flags, count, string_count = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            view.release()
+            raise ValueError(f"{path} is not a version {VERSION} book catalog file.")
+        catalog = {"count": count, "sorted": bool(flags & SORTED_IDS)}
+        offset = HEADER.size
+        for name, code, length in (("ids", "q", count), ("titles", "I", count), ("authors", "I", count),
+                                   ("extras", "I", count), ("available", "B", count),
+                                   ("offsets", "I", string_count + 1)):
+            catalog[name], offset = _column(view, offset, length, code)
+        catalog["strings"] = view[offset:]
+        try:
+            yield catalog
+        finally:
+            # Views into the mapping must be released before it can be closed
+            for value in catalog.values():
+                if isinstance(value, memoryview):
+                    value.release()
+            view.release()
+
+
+# Function to get a string of the string table
+def string_at(catalog, ref):
+    offsets = catalog["offsets"]
+    return str(catalog["strings"][offsets[ref]:offsets[ref + 1]], "utf-8")
+
+
+# Function to build the record of the book in the given row
+def book_at(catalog, row):
+    book = {"title": string_at(catalog, catalog["titles"][row]),
+            "author": string_at(catalog, catalog["authors"][row]),
+            "available": bool(catalog["available"][row]),
+            "id": catalog["ids"][row]}
+    extra = string_at(catalog, catalog["extras"][row])
+    if extra:
+        book.update(json.loads(extra))
+    return book
+
+
+# Function to stream the books of a catalog as records, one at a time
+def iter_books(catalog):
+    for row in range(catalog["count"]):
+        yield book_at(catalog, row)
+
+
+# Function to find the row of a book by ID, or None
+def find_row(catalog, book_id):
+    ids = catalog["ids"]
+    if catalog["sorted"]:
+        row = bisect.bisect_left(ids, book_id)
+        return row if row < len(ids) and ids[row] == book_id else None
+    for row, other_id in enumerate(ids):
+        if other_id == book_id:
+            return row
+    return None
+
+
+# Function to count the available books by scanning the availability column
+def available_count(catalog):
+    return bytes(catalog["available"]).count(1)
+
+
+# Function to stream the IDs of the available books
+def available_ids(catalog):
+    return itertools.compress(catalog["ids"], catalog["available"])
+
+
+# Function to read every book of a catalog file
+def read_catalog(path=CATALOG_FILE):
+    with open_catalog(path) as catalog:
+        return list(iter_books(catalog))
+
+
+# Function to write the books of the store to a catalog file
+def export_catalog(path=CATALOG_FILE):
+    count = write_catalog(store.iter_records(BOOKS_FILE), path)
+    print(f"Exported {count} books from {BOOKS_FILE} to {path}.")
+
+
+# Function to replace the books of the store with those of a catalog file
+def import_catalog(path=CATALOG_FILE):
+    books = read_catalog(path)
+    with store.transaction():
+        store.replace(BOOKS_FILE, books)
+    print(f"Imported {len(books)} books from {path} to {BOOKS_FILE}.")
+
+
+# Main function for the catalog converter
+def catalog_main():
+    parser = argparse.ArgumentParser(description="Convert the book catalog to and from the compact binary format.")
+    parser.add_argument("direction", choices=["export", "import"],
+                        help=f"export writes {BOOKS_FILE} as a catalog file, import reads one back")
+    parser.add_argument("path", nargs="?", default=CATALOG_FILE)
+    args = parser.parse_args()
+    if args.direction == "export":
+        export_catalog(args.path)
+    else:
+        import_catalog(args.path)
+
+
+if __name__ == "__main__":
+    catalog_main()
@@ -1,50 +1,59 @@
-import json
+import itertools
+from datetime import datetime
 
-# Define global variables for data files
-BOOKS_FILE = "Books.dat"
-BORROWS_FILE = "Borrows.dat"
-RESERVATIONS_FILE = "Reservations.dat"
-MEMBERS_FILE = "Members.dat"
-
-# Initialize data files with empty lists if they don't exist
-for file in [BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE]:
-    try:
-        with open(file, "r") as f:
-            pass
-    except FileNotFoundError:
-        with open(file, "w") as f:
-            json.dump([], f)
+import availability
+import history
+import instrumentation
+import limits
+import paging
+import reservation_queue
+import search_index
+import store
+from records import Borrow, Reservation
+from store import BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE
 
 
 # Function to read data from a file
+@instrumentation.timed()
 def read_data(file_name):
-    with open(file_name, "r") as file:
-        data = json.load(file)
-    return data
+    return store.records(file_name)
 
 
 # Function to write data to a file
+@instrumentation.timed()
 def write_data(data, file_name):
-    with open(file_name, "w") as file:
-        json.dump(data, file)
+    store.replace(file_name, data)
+
+
+# Function to get the cache key of a book listing, or None to stream the catalog rather than load it
+def _listing_key(name):
+    version = store.loaded_version(BOOKS_FILE)
+    return None if version is None else (name, version)
+
+
+# Function to format a book as a row of the book listings
+def _book_row(book):
+    return "{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"],
+                                               "Yes" if book["available"] else "No")
 
 
-# Function to list all books
-def list_all_books():
-    books = read_data(BOOKS_FILE)
-    if books:
+# Function to list all books, reusing pages formatted earlier while no book has changed
+@instrumentation.timed()
+def list_all_books(offset=0, limit=None):
+    lines = paging.cached_lines(_listing_key("customer.books"), lambda: store.iter_records(BOOKS_FILE),
+                                _book_row, offset, limit)
+    first_line = next(lines, None)
+    if first_line is not None:
         print("All Books:")
         print("{:<5} {:<30} {:<20} {:<10}".format("ID", "Title", "Author", "Available"))
-        for book in books:
-            available_status = "Yes" if book["available"] else "No"
-            print("{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"], available_status))
+        paging.print_lines(itertools.chain([first_line], lines), limit)
     else:
         print("No books found.")
 
 # Function to search for books
+@instrumentation.timed()
 def search_books(keyword):
-    books = read_data(BOOKS_FILE)
-    found_books = [book for book in books if keyword.lower() in book["title"].lower()]
+    found_books = search_index.search(keyword)
     if found_books:
         print("Found Books:")
         for book in found_books:
@@ -53,15 +62,16 @@ def search_books(keyword):
         print("No books found.")
 
 
-# Function to display list of available books
-def display_available_books():
-    books = read_data(BOOKS_FILE)
-    available_books = [book for book in books if book["available"]]
-    if available_books:
+# Function to display list of available books, reusing pages formatted earlier while no book has changed
+@instrumentation.timed()
+def display_available_books(offset=0, limit=None):
+    lines = paging.cached_lines(_listing_key("customer.available"), availability.available_books,
+                                _book_row, offset, limit)
+    first_line = next(lines, None)
+    if first_line is not None:
         print("Available Books:")
         print("{:<5} {:<30} {:<20} {:<10}".format("ID", "Title", "Author", "Available"))
-        for book in available_books:
-            print("{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"], "Yes"))
+        paging.print_lines(itertools.chain([first_line], lines), limit)
     else:
         print("No books available.")
 
@@ -72,70 +82,74 @@ def print_book_info(book):
 
 
 # Function to borrow or make a reservation for a book
+@instrumentation.timed()
 def borrow_or_reserve_book(book_id, member_id):
-    books = read_data(BOOKS_FILE)
-
-    for book in books:
-        if book["id"] == book_id:
-            if book["available"]:
-                book["available"] = False
-                write_data(books, BOOKS_FILE)
-
-                borrows = read_data(BORROWS_FILE)
-                borrows.append({"book_id": book_id, "member_id": member_id})
-                write_data(borrows, BORROWS_FILE)
-
-                print("Book borrowed successfully.")
-            else:
-                reservations = read_data(RESERVATIONS_FILE)
-                existing_reservation = next(
-                    (r for r in reservations if r["book_id"] == book_id and r["member_id"] == member_id), None)
-                if existing_reservation:
-                    print("Reservation already made.")
-                else:
-                    choice = input("Book is currently unavailable. Do you want to make a reservation? (yes/no): ")
-                    if choice.lower() == "yes":
-                        make_reservation(book_id, member_id)
-                    else:
-                        print("No reservation made.")
+    with store.transaction():
+        book = store.get(BOOKS_FILE, book_id)
+        if book is None:
+            print("Book not found.")
             return
-    print("Book not found.")
 
+        if book["available"]:
+            reason = limits.check_loan(member_id)
+            if reason:
+                print(reason)
+                return
+            store.update(BOOKS_FILE, book_id, {"available": False})
+            store.insert(BORROWS_FILE, Borrow(book_id=book_id, member_id=member_id, borrowed_at=history.now()))
+            print("Book borrowed successfully.")
+            return
+        already_reserved = store.exists(RESERVATIONS_FILE, (book_id, member_id))
 
-# Function to make a reservation
-def make_reservation(book_id, member_id):
-    reservations = read_data(RESERVATIONS_FILE)
-    books = read_data(BOOKS_FILE)
-    # Check if the book or member exists
-    if not any(book["id"] == book_id for book in books):
-        print("Book not found.")
-        return False
-    if not any(member["id"] == member_id for member in read_data(MEMBERS_FILE)):
-        print("Member not found.")
-        return False
-    # Check if the reservation already exists
-    if any(reservation["book_id"] == book_id and reservation["member_id"] == member_id for reservation in reservations):
+    # Ask about a reservation outside the transaction so other desks are not kept waiting
+    if already_reserved:
         print("Reservation already made.")
-        return False
+    else:
+        with instrumentation.waiting():
+            choice = input("Book is currently unavailable. Do you want to make a reservation? (yes/no): ")
+        if choice.lower() == "yes":
+            make_reservation(book_id, member_id)
+        else:
+            print("No reservation made.")
+
 
-    # Add the reservation
-    reservations.append({"book_id": book_id, "member_id": member_id})
-    write_data(reservations, RESERVATIONS_FILE)
+# Function to make a reservation
+@instrumentation.timed()
+def make_reservation(book_id, member_id):
+    with store.transaction():
+        # Check if the book or member exists
+        if not store.exists(BOOKS_FILE, book_id):
+            print("Book not found.")
+            return False
+        if not store.exists(MEMBERS_FILE, member_id):
+            print("Member not found.")
+            return False
+        # Check if the reservation already exists
+        if store.exists(RESERVATIONS_FILE, (book_id, member_id)):
+            print("Reservation already made.")
+            return False
+        reason = limits.check_reservation(member_id)
+        if reason:
+            print(reason)
+            return False
+
+        # Add the reservation
+        store.insert(RESERVATIONS_FILE, Reservation(book_id=book_id, member_id=member_id,
+                                                 reserved_at=datetime.now().isoformat(timespec="seconds")))
+        place = reservation_queue.queue_length(book_id)
     print("Reservation made successfully.")
+    print(f"Position in queue: {place}")
     return True
 
 
+@instrumentation.timed()
 def list_borrowed_books_by_member(member_id):
-    borrows = read_data(BORROWS_FILE)
-    books = read_data(BOOKS_FILE)
-
+    books = store.lookup_table(BOOKS_FILE)
     borrowed_books = []
-    for borrow in borrows:
-        if borrow["member_id"] == member_id:
-            for book in books:
-                if book["id"] == borrow["book_id"]:
-                    borrowed_books.append(book)
-                    break
+    for borrow in store.find(BORROWS_FILE, "member_id", member_id):
+        book = books.get(borrow["book_id"])
+        if book:
+            borrowed_books.append(book)
 
     if borrowed_books:
         print(f"Borrowed Books for Member ID {member_id}:")
@@ -146,6 +160,22 @@ def list_borrowed_books_by_member(member_id):
         print("No borrowed books found for this member.")
 
 
+# Function to show the borrow history of a member
+@instrumentation.timed()
+def show_borrow_history(member_id):
+    loans = history.member_history(member_id)
+    if loans:
+        books = store.lookup_table(BOOKS_FILE)
+        print(f"Borrow History for Member ID {member_id}:")
+        print("{:<5} {:<30} {:<20} {:<20}".format("ID", "Title", "Borrowed At", "Returned At"))
+        for loan in loans:
+            book = books.get(loan["book_id"])
+            print("{:<5} {:<30} {:<20} {:<20}".format(loan["book_id"], book["title"] if book else "Not found",
+                                                      loan["borrowed_at"] or "-", loan["returned_at"]))
+    else:
+        print("No borrow history found for this member.")
+
+
 # Main function for customer application
 def customer_main():
     print("Welcome to LMS Customer Application")
@@ -159,8 +189,9 @@ def customer_main():
         print("3. List all books")
         print("4. Display available books")
         print("5. List of borrowed a book")
+        print("6. Borrow history")
 
-        print("6. Exit")
+        print("7. Exit")
 
 
 
@@ -173,7 +204,6 @@ def customer_main():
 
         elif choice == "2":
             book_id = int(input("Enter book ID to borrow: "))
-            books = read_data(BOOKS_FILE)
             # Check if the book or member exists
             '''
             if not any(book["id"] == book_id for book in books):
@@ -197,7 +227,14 @@ def customer_main():
             list_borrowed_books_by_member(member_id)
 
         elif choice == "6":
+            member_id = int(input("Enter your member ID: "))
+            show_borrow_history(member_id)
+
+        elif choice == "7":
             print("Exiting Customer Application...")
+            store.checkpoint()
+            store.save_cache()
+            instrumentation.finish()
             break
         else:
             print("Invalid choice. Please select again.")
@@ -0,0 +1,144 @@
+import json
+import os
+from datetime import datetime
+
+import records
+import store
+
+# Directory of the borrow history, one append-only JSONL partition per month of return
+ARCHIVE_DIR = "History"
+PARTITION_SUFFIX = ".jsonl"
+
+# Sidecar file of each partition mapping member and book IDs to the offsets of their lines, so a history query
+# reads only the matching lines, and how far into the partition it is up to date
+INDEX_SUFFIX = ".idx"
+
+# Partition indexes loaded by this process
+_partitions = {}
+
+
+# Function to get the current time as stored in the history
+def now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+# Function to get the partition holding loans returned at the given time, e.g. 2024-05
+def _partition_name(returned_at):
+    return returned_at[:7]
+
+
+# Function to get the path of a partition file
+def _partition_path(name):
+    return os.path.join(ARCHIVE_DIR, name + PARTITION_SUFFIX)
+
+
+# Function to archive returned loans as part of the transaction removing them from the active borrows, so a
+# loan is in the history exactly when it is no longer borrowed, even if the process crashes
+def archive(borrows, returned_at=None):
+    if not borrows:
+        return
+    returned_at = returned_at or now()
+    lines = "".join(json.dumps({"book_id": borrow["book_id"], "member_id": borrow["member_id"],
+                                "borrowed_at": borrow.get("borrowed_at"), "returned_at": returned_at},
+                               default=records.to_json) + "\n" for borrow in borrows)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    store.append_on_commit(_partition_path(_partition_name(returned_at)), lines)
+
+
+# Function to list the partitions overlapping a range of return dates (ISO strings, either end optional)
+def _partition_names(since=None, until=None):
+    try:
+        names = sorted(file_name[:-len(PARTITION_SUFFIX)] for file_name in os.listdir(ARCHIVE_DIR)
+                       if file_name.endswith(PARTITION_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [name for name in names
+            if (since is None or name >= since[:7]) and (until is None or name <= until[:7])]
+
+
+# Function to get the path of a partition's index
+def _index_path(name):
+    return os.path.join(ARCHIVE_DIR, name + INDEX_SUFFIX)
+
+
+# Function to read the loans of a partition from a byte offset as (line offset, loan) pairs, stopping before an
+# incomplete last line, and the offset reached
+def _read_partition(name, offset=0):
+    loans = []
+    with open(_partition_path(name), "rb") as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                loans.append((offset, json.loads(line)))
+            except ValueError:
+                pass
+            offset += len(line)
+    return loans, offset
+
+
+# Function to read the saved index of a partition, or an empty one
+def _load_index(name):
+    try:
+        with open(_index_path(name), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"offset": 0, "member_id": {}, "book_id": {}}
+
+
+# Function to get the index of a partition, adding only the lines appended since it was last saved
+def _partition_index(name):
+    index = _partitions.get(name)
+    if index is None:
+        index = _partitions[name] = _load_index(name)
+    size = os.path.getsize(_partition_path(name))
+    if size < index["offset"]:
+        # The partition was replaced, index it again from the start
+        index = _partitions[name] = {"offset": 0, "member_id": {}, "book_id": {}}
+    if size > index["offset"]:
+        loans, offset = _read_partition(name, index["offset"])
+        if offset > index["offset"]:
+            for line_offset, loan in loans:
+                # Keys are strings, as JSON object keys are
+                index["member_id"].setdefault(str(loan["member_id"]), []).append(line_offset)
+                index["book_id"].setdefault(str(loan["book_id"]), []).append(line_offset)
+            index["offset"] = offset
+            temp_path = f"{_index_path(name)}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as file:
+                json.dump(index, file, separators=(",", ":"))
+            os.replace(temp_path, _index_path(name))
+    return index
+
+
+# Function to read the loans at the given line offsets of a partition
+def _read_lines(name, offsets):
+    loans = []
+    with open(_partition_path(name), "rb") as file:
+        for offset in offsets:
+            file.seek(offset)
+            loans.append(json.loads(file.readline()))
+    return loans
+
+
+# Function to get the archived loans with the given member or book ID, oldest return first
+def _history(field, value, since=None, until=None):
+    loans = []
+    for name in _partition_names(since, until):
+        offsets = _partition_index(name)[field].get(str(value))
+        if not offsets:
+            continue
+        loans.extend(loan for loan in _read_lines(name, offsets) if loan[field] == value
+                     and (since is None or loan["returned_at"] >= since)
+                     and (until is None or loan["returned_at"][:len(until)] <= until))
+    return loans
+
+
+# Function to get the borrow history of a member
+def member_history(member_id, since=None, until=None):
+    return _history("member_id", member_id, since, until)
+
+
+# Function to get the borrow history of a book
+def book_history(book_id, since=None, until=None):
+    return _history("book_id", book_id, since, until)
@@ -0,0 +1,124 @@
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Opt-in profiling: "summary" prints a per-operation table on exit, a path ending in .json gets a full trace
+PROFILE = os.environ.get("LMS_PROFILE", "")
+ENABLED = bool(PROFILE)
+
+# Counters kept per operation and per storage call
+COUNTERS = ("calls", "wall", "parse", "bytes_read", "bytes_written")
+
+# Totals by operation name
+_stats = {}
+
+# Operations running right now, outermost first, and the finished ones in order when tracing
+_open_spans = []
+_trace = []
+
+# Start of the profiling session
+_started = time.perf_counter()
+
+
+# Function to add an amount to a counter of every running operation, so a desk operation includes its storage calls
+def _add(counter, amount):
+    for span in _open_spans:
+        span[counter] += amount
+
+
+# Function to record bytes read from storage
+def add_bytes_read(count):
+    if ENABLED:
+        _add("bytes_read", count)
+
+
+# Function to record bytes written to storage
+def add_bytes_written(count):
+    if ENABLED:
+        _add("bytes_written", count)
+
+
+# Function to record time spent decoding stored data
+def add_parse_time(seconds):
+    if ENABLED:
+        _add("parse", seconds)
+
+
+# Function to leave time spent waiting for the user out of the running operations
+@contextmanager
+def waiting():
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add("wait", time.perf_counter() - start)
+
+
+# Function to finish a span and fold it into the totals of its operation
+def _close(span, start):
+    span["wall"] = time.perf_counter() - start - span.pop("wait")
+    totals = _stats.setdefault(span["name"], dict.fromkeys(COUNTERS, 0))
+    for counter in COUNTERS:
+        totals[counter] += span[counter]
+    if PROFILE.endswith(".json"):
+        span["start"] = start - _started
+        span["depth"] = len(_open_spans)
+        _trace.append(span)
+
+
+# Decorator recording calls, wall time, parse time and bytes moved by a function under the given name
+def timed(name=None):
+    def decorate(function):
+        if not ENABLED:
+            return function
+        module = function.__module__
+        if module == "__main__":
+            # Name the entry point module after its file, e.g. staff rather than __main__
+            module = os.path.splitext(os.path.basename(function.__code__.co_filename))[0]
+        span_name = name or f"{module}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            span = dict.fromkeys(COUNTERS, 0)
+            span.update(name=span_name, calls=1, wait=0)
+            _open_spans.append(span)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _open_spans.pop()
+                _close(span, start)
+        return wrapper
+    return decorate
+
+
+# Function to print the totals of every operation, slowest first
+def print_summary():
+    print("{:<45} {:>7} {:>11} {:>11} {:>12} {:>12}".format(
+        "Operation", "Calls", "Wall ms", "Parse ms", "Read KiB", "Written KiB"))
+    for name, totals in sorted(_stats.items(), key=lambda item: -item[1]["wall"]):
+        print("{:<45} {:>7} {:>11.3f} {:>11.3f} {:>12.1f} {:>12.1f}".format(
+            name, totals["calls"], totals["wall"] * 1000, totals["parse"] * 1000,
+            totals["bytes_read"] / 1024, totals["bytes_written"] / 1024))
+
+
+# Function to write the totals and every recorded call as JSON
+def write_trace(path):
+    with open(path, "w") as file:
+        json.dump({"operations": _stats, "calls": _trace}, file, indent=1)
+
+
+# Function to report what was recorded, called when an application exits
+def finish():
+    if not ENABLED:
+        return
+    if PROFILE.endswith(".json"):
+        write_trace(PROFILE)
+        print(f"Profile trace written to {PROFILE}.")
+    else:
+        print_summary()
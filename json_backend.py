@@ -0,0 +1,362 @@
+import json
+import os
+import time
+
+import instrumentation
+import records
+import store
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Append mutations to a per-collection journal instead of rewriting the whole file
+JOURNAL_MODE = True
+
+# Number of journal entries after which a collection is folded back into its snapshot
+COMPACT_THRESHOLD = 1000
+
+# Flush every commit to the disk before returning
+SYNC_WRITES = True
+
+# Characters read at a time when streaming a snapshot file
+STREAM_CHUNK_SIZE = 1 << 16
+
+# File locked by whichever process is writing, and the record of an in-flight multi-file commit
+LOCK_FILE = "LMS.lock"
+TRANSACTION_FILE = "LMS.txn"
+
+
+# Function to initialize data files with empty lists if they don't exist
+def initialize():
+    for file in store.COLLECTIONS:
+        try:
+            with open(file, "r") as f:
+                pass
+        except FileNotFoundError:
+            with open(file, "w") as f:
+                json.dump([], f)
+
+
+# Function to get the modification stamp of a file
+def _file_stamp(file_name):
+    stat = os.stat(file_name)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Function to get the name of the journal file of a collection
+def _log_name(file_name):
+    return file_name + ".log"
+
+
+# Function to flush a written file all the way to the disk
+def _sync(file):
+    file.flush()
+    if SYNC_WRITES:
+        os.fsync(file.fileno())
+
+
+# Function to write JSON content to a synced temporary file next to the target
+def _write_temp(file_name, data):
+    temp_name = file_name + ".tmp"
+    with open(temp_name, "w") as file:
+        # json.dumps uses the C encoder, json.dump would encode chunk by chunk in Python
+        text = json.dumps(data, default=records.to_json)
+        file.write(text)
+        instrumentation.add_bytes_written(len(text))
+        _sync(file)
+    return temp_name
+
+
+# Function to replace a file with new JSON content so readers see either the old or the new version
+def _write_atomic(file_name, data):
+    os.replace(_write_temp(file_name, data), file_name)
+
+
+# Function to encode journal entries as log lines
+def _encode_entries(entries):
+    return b"".join((json.dumps(entry, separators=(",", ":"), default=records.to_json) + "\n").encode() for entry in entries)
+
+
+# Function to read a whole collection from its snapshot file
+@instrumentation.timed()
+def read_collection(file_name):
+    stamp = _file_stamp(file_name)
+    with open(file_name, "r") as file:
+        text = file.read()
+    instrumentation.add_bytes_read(stamp[1])
+    start = time.perf_counter()
+    records = json.loads(text)
+    instrumentation.add_parse_time(time.perf_counter() - start)
+    return records, {"stamp": stamp, "offset": 0, "entries": 0, "torn": False}
+
+
+# Function to stream the elements of a JSON array file one at a time
+def _iter_json_array(file_name):
+    decoder = json.JSONDecoder()
+    with open(file_name, "r") as file:
+        buffer = file.read(STREAM_CHUNK_SIZE)
+        instrumentation.add_bytes_read(len(buffer))
+        buffer = buffer.lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{file_name} does not contain a JSON list.")
+        position = 1
+        at_end = False
+        while True:
+            # Skip the separators between elements
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if at_end:
+                        raise
+                else:
+                    # An element running up to the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or at_end:
+                        yield record
+                        position = end
+                        continue
+            elif at_end:
+                raise ValueError(f"{file_name} ends before its JSON list is closed.")
+            chunk = file.read(STREAM_CHUNK_SIZE)
+            instrumentation.add_bytes_read(len(chunk))
+            at_end = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+# Function to stream the records of a collection, or None if pending journal entries require a full load
+def iter_collection(file_name):
+    if JOURNAL_MODE:
+        try:
+            if os.stat(_log_name(file_name)).st_size:
+                return None
+        except FileNotFoundError:
+            pass
+    return _iter_json_array(file_name)
+
+
+# Function to get the name of the file describing the last rewrite of a collection's snapshot
+def _fold_name(file_name):
+    return file_name + ".fold"
+
+
+# Function to record that a new snapshot holds the old one, its whole journal and the given entries,
+# so other processes that had read all of that can move to the new snapshot without parsing it
+def _record_fold(file_name, old_position, new_position, entries):
+    _write_atomic(_fold_name(file_name), {"from": list(old_position["stamp"]), "offset": old_position["offset"],
+                                          "to": list(new_position["stamp"]), "entries": entries})
+
+
+# Function to move a position to a rewritten snapshot, returning the entries it adds, or None if it must be re-read
+def _read_fold(file_name, position, stamp):
+    try:
+        with open(_fold_name(file_name), "r") as file:
+            fold = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if fold["from"] != list(position["stamp"]) or fold["offset"] != position["offset"] or fold["to"] != list(stamp):
+        return None
+    position.update(stamp=stamp, offset=0, entries=0, torn=False)
+    return fold["entries"]
+
+
+# Function to read journal entries appended since the given position, or None if the snapshot must be re-read
+@instrumentation.timed()
+def read_changes(file_name, position):
+    stamp = _file_stamp(file_name)
+    entries = []
+    if stamp != position["stamp"]:
+        entries = _read_fold(file_name, position, stamp)
+        if entries is None:
+            return None
+    if not JOURNAL_MODE:
+        return entries
+    log_name = _log_name(file_name)
+    try:
+        size = os.stat(log_name).st_size
+    except FileNotFoundError:
+        size = 0
+    if size == position["offset"]:
+        return entries
+    if size < position["offset"]:
+        # The log was truncated behind our back
+        return None
+    folded_count = len(entries)
+    instrumentation.add_bytes_read(size - position["offset"])
+    start = time.perf_counter()
+    with open(log_name, "rb") as file:
+        file.seek(position["offset"])
+        position["torn"] = False
+        for line in file:
+            # A line without a newline is a write cut short by a crash, stop there
+            if not line.endswith(b"\n"):
+                position["torn"] = True
+                break
+            position["offset"] += len(line)
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Remains of a torn write that was followed by newer entries
+                continue
+    instrumentation.add_parse_time(time.perf_counter() - start)
+    # A snapshot replaced while the log was read means part of what was read belongs to the next journal
+    if _file_stamp(file_name) != stamp:
+        return None
+    position["entries"] += len(entries) - folded_count
+    return entries
+
+
+# Function to append journal entries to the log of a collection
+def _append_log(collection, entries):
+    position = collection["position"]
+    lines = _encode_entries(entries)
+    if position["torn"]:
+        # Terminate the torn entry so it does not swallow the new ones
+        lines = b"\n" + lines
+        position["torn"] = False
+    with open(_log_name(collection["file_name"]), "ab") as file:
+        file.write(lines)
+        _sync(file)
+        instrumentation.add_bytes_written(len(lines))
+        position["offset"] = file.tell()
+    position["entries"] += len(entries)
+
+
+# Function to get a copy of a position that another process can resume from, file stamps and offsets are shared
+def portable_position(position):
+    return dict(position)
+
+
+# Function to empty the journal of a collection whose snapshot was just replaced, returning the new position
+def _snapshot_written(file_name):
+    if JOURNAL_MODE:
+        with open(_log_name(file_name), "w"):
+            pass
+    # Remember our own write so it is not mistaken for another process's edit
+    return {"stamp": _file_stamp(file_name), "offset": 0, "entries": 0, "torn": False}
+
+
+# Function to write a whole collection as its snapshot file and empty its journal
+@instrumentation.timed()
+def write_collection(file_name, records):
+    _write_atomic(file_name, records)
+    return _snapshot_written(file_name)
+
+
+# Function to merge the (path, text) appends of a transaction by file and find the offset each one starts at
+def _plan_appends(appends):
+    texts = {}
+    for path, text in appends:
+        texts[path] = texts.get(path, "") + text
+    return [{"path": path, "offset": os.path.getsize(path) if os.path.exists(path) else 0, "text": text}
+            for path, text in texts.items()]
+
+
+# Function to write the mutations of a transaction, given as (collection, entries) pairs, and the (path, text)
+# appends to files outside the store that commit with them
+@instrumentation.timed()
+def write(changes, appends=()):
+    appends = _plan_appends(appends)
+    multi_file = len(changes) > 1 or bool(appends)
+    # A collection whose journal would reach the compaction threshold is written as a new snapshot straight away,
+    # so a bulk commit is folded in by this commit rather than rewritten by the next one
+    temp_names = {collection["file_name"]: _write_temp(collection["file_name"], list(collection["rows"].values()))
+                  for collection, entries in changes
+                  if not JOURNAL_MODE or collection["position"]["entries"] + len(entries) >= COMPACT_THRESHOLD}
+    if multi_file:
+        # Record the whole commit first so a crash cannot leave only some files updated
+        _write_atomic(TRANSACTION_FILE, {
+            "entries": {c["file_name"]: e for c, e in changes if c["file_name"] not in temp_names},
+            "snapshots": list(temp_names),
+            "appends": appends})
+    for collection, entries in changes:
+        file_name = collection["file_name"]
+        if file_name in temp_names:
+            old_position = dict(collection["position"])
+            if JOURNAL_MODE:
+                # Journal the commit before swapping the snapshot: if the log is not emptied because of a crash,
+                # replaying all of it over the new snapshot still ends in the committed state
+                _append_log(collection, entries)
+            os.replace(temp_names[file_name], file_name)
+            collection["position"] = _snapshot_written(file_name)
+            if len(entries) < COMPACT_THRESHOLD:
+                _record_fold(file_name, old_position, collection["position"], entries)
+        else:
+            _append_log(collection, entries)
+    for append in appends:
+        store.write_at(append["path"], append["offset"], append["text"])
+    if multi_file:
+        os.remove(TRANSACTION_FILE)
+
+
+# Function to fold the journal of a collection into its snapshot file
+@instrumentation.timed()
+def checkpoint(collection):
+    old_position = collection["position"]
+    if old_position["entries"]:
+        collection["position"] = write_collection(collection["file_name"], list(collection["rows"].values()))
+        _record_fold(collection["file_name"], old_position, collection["position"], [])
+
+
+# Function to finish a commit that a crashed process left half written
+def _recover():
+    try:
+        with open(TRANSACTION_FILE, "r") as file:
+            intent = json.load(file)
+    except FileNotFoundError:
+        return
+    # Journal entries are safe to apply twice, so simply append the whole commit again
+    for file_name, entries in intent.get("entries", {}).items():
+        with open(_log_name(file_name), "ab") as file:
+            file.write(b"\n" + _encode_entries(entries))
+            _sync(file)
+    # The intent is written after every temporary snapshot is complete, a missing one was already moved in place
+    for file_name in intent.get("snapshots", []):
+        if os.path.exists(file_name + ".tmp"):
+            os.replace(file_name + ".tmp", file_name)
+        _snapshot_written(file_name)
+    # Appends are written again from where they started, replacing whatever part of them made it to disk
+    for append in intent.get("appends", []):
+        store.write_at(append["path"], append["offset"], append["text"])
+    os.remove(TRANSACTION_FILE)
+
+
+# Function to take the inter-process write lock
+@instrumentation.timed()
+def begin():
+    lock = open(LOCK_FILE, "a+")
+    if fcntl is not None:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+    else:
+        lock.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                # LK_LOCK gives up after ten seconds, keep waiting for the other desk
+                continue
+    try:
+        _recover()
+    except BaseException:
+        end(lock, False)
+        raise
+    return lock
+
+
+# Function to release the inter-process write lock
+@instrumentation.timed()
+def end(lock, committed):
+    if fcntl is not None:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+    else:
+        lock.seek(0)
+        msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+    lock.close()
@@ -0,0 +1,32 @@
+import os
+
+import store
+from store import BORROWS_FILE, RESERVATIONS_FILE
+
+# Books a member may have on loan, and reservations a member may hold, at the same time; 0 means no limit
+LOAN_LIMIT = int(os.environ.get("LMS_LOAN_LIMIT", "0"))
+RESERVATION_LIMIT = int(os.environ.get("LMS_RESERVATION_LIMIT", "0"))
+
+
+# Function to count a member's active loans, from the borrows grouped by member
+def loan_count(member_id):
+    return store.count_where(BORROWS_FILE, "member_id", member_id)
+
+
+# Function to count a member's reservations, from the reservations grouped by member
+def reservation_count(member_id):
+    return store.count_where(RESERVATIONS_FILE, "member_id", member_id)
+
+
+# Function to get why a member may not borrow another book, or None if they may
+def check_loan(member_id):
+    if LOAN_LIMIT and loan_count(member_id) >= LOAN_LIMIT:
+        return f"Loan limit reached ({LOAN_LIMIT} books per member)."
+    return None
+
+
+# Function to get why a member may not reserve another book, or None if they may
+def check_reservation(member_id):
+    if RESERVATION_LIMIT and reservation_count(member_id) >= RESERVATION_LIMIT:
+        return f"Reservation limit reached ({RESERVATION_LIMIT} per member)."
+    return None
@@ -0,0 +1,18 @@
+import store
+import sqlite_backend
+
+
+# Function to copy every collection from the .dat files into the SQLite database
+def migrate_to_sqlite():
+    store.use_backend("json")
+    collections = {file_name: list(store.records(file_name)) for file_name in store.COLLECTIONS}
+
+    store.use_backend("sqlite")
+    with store.transaction():
+        for file_name, records in collections.items():
+            store.replace(file_name, records)
+            print(f"Migrated {len(records)} records from {file_name} to {sqlite_backend.DATABASE_FILE}.")
+
+
+if __name__ == "__main__":
+    migrate_to_sqlite()
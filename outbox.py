@@ -0,0 +1,62 @@
+import atexit
+import json
+import os
+import threading
+
+import history
+import records
+import store
+
+# Local file notification events are appended to, one JSON object per line, for a consumer on this machine
+OUTBOX_FILE = "Outbox.jsonl"
+
+# Events held in memory before they are written out together, and the longest an event waits for the rest
+OUTBOX_BATCH_SIZE = int(os.environ.get("LMS_OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_FLUSH_INTERVAL = float(os.environ.get("LMS_OUTBOX_FLUSH_INTERVAL", "5"))
+
+# Committed events not written to the outbox yet, and the timer that writes them once the oldest is due
+_pending = {"events": [], "timer": None}
+
+# Held between taking events and writing them, the timer flushes from its own thread
+_lock = threading.Lock()
+
+
+# Function to hold a committed event until its batch is written
+def _buffer(event):
+    with _lock:
+        _pending["events"].append(event)
+        if _pending["timer"] is None:
+            # Write the batch when the first event in it has waited long enough, even if no other event comes
+            timer = _pending["timer"] = threading.Timer(OUTBOX_FLUSH_INTERVAL, flush)
+            timer.daemon = True
+            timer.start()
+        full = len(_pending["events"]) >= OUTBOX_BATCH_SIZE
+    if full:
+        flush()
+
+
+# Function to queue a notification event, which is only sent if the current transaction is committed
+def enqueue(event_type, **fields):
+    event = {"event": event_type, "at": history.now(), **fields}
+    store.on_commit(lambda: _buffer(event))
+
+
+# Function to append the held events to the outbox file in one write
+def flush():
+    with _lock:
+        timer, _pending["timer"] = _pending["timer"], None
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+        events = _pending["events"]
+        if not events:
+            return
+        lines = "".join(json.dumps(event, default=records.to_json) + "\n" for event in events)
+        with open(OUTBOX_FILE, "a") as file:
+            file.write(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        _pending["events"] = []
+
+
+# Write whatever is still held when the process exits
+atexit.register(flush)
@@ -0,0 +1,65 @@
+import itertools
+
+import instrumentation
+import result_cache
+
+# Number of rows shown before asking whether to continue
+PAGE_SIZE = 20
+
+
+# Function to take one page of rows by offset and limit, without reading past it
+def select(rows, offset=0, limit=None):
+    stop = None if limit is None else offset + limit
+    return itertools.islice(rows, offset, stop)
+
+
+# Function to print lines a page at a time, asking before showing the next page
+def print_paged(lines, page_size=PAGE_SIZE):
+    lines = iter(lines)
+    line = next(lines, None)
+    shown = 0
+    while line is not None:
+        print(line)
+        shown += 1
+        line = next(lines, None)
+        if line is not None and shown % page_size == 0:
+            with instrumentation.waiting():
+                answer = input("-- More: press Enter to continue or q to stop: ")
+            if answer.strip().lower() == "q":
+                break
+
+
+# Function to print listing lines, a page at a time unless an explicit limit was asked for
+def print_lines(lines, limit=None):
+    if limit is None:
+        print_paged(lines)
+    else:
+        for line in lines:
+            print(line)
+
+
+# Function to format listing rows a page at a time, reusing pages cached under the same key; the key must name
+# the listing and the version of the data it shows, and rows is called only when a page has to be formatted.
+# A key of None streams the rows without caching, e.g. when the data is not loaded and has no version yet
+def cached_lines(key, rows, format_line, offset=0, limit=None):
+    if key is None:
+        yield from (format_line(row) for row in select(rows(), offset, limit))
+        return
+    stop = None if limit is None else offset + limit
+    start = offset
+    stream = None
+    while stop is None or start < stop:
+        size = PAGE_SIZE if stop is None else min(PAGE_SIZE, stop - start)
+        page_key = key + (start, size)
+        if stream is None:
+            lines = result_cache.get(page_key)
+            if lines is None:
+                # Carry on from here with one pass over the rows, caching the pages as they are formatted
+                stream = select(rows(), start)
+        if stream is not None:
+            lines = [format_line(row) for row in itertools.islice(stream, size)]
+            result_cache.put(page_key, lines)
+        yield from lines
+        if len(lines) < size:
+            return
+        start += size
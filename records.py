@@ -0,0 +1,106 @@
+import sys
+from collections.abc import MutableMapping
+
+
+# Base of the record types: fixed fields in slots instead of a per-record dict, read and written like a dict
+class Record(MutableMapping):
+    __slots__ = ("_extra",)
+
+    # Fields stored in slots, in the order they are written to the .dat files
+    FIELDS = ()
+
+    # Text fields whose values repeat across records and are worth sharing, e.g. author names
+    SHARED_FIELDS = ()
+
+    def __init__(self, data=(), **fields):
+        self._extra = None
+        for source in (data, fields):
+            for field, value in (source.items() if hasattr(source, "items") else source):
+                self[field] = value
+
+    def __getitem__(self, field):
+        if field in self.FIELDS:
+            try:
+                return getattr(self, field)
+            except AttributeError:
+                raise KeyError(field) from None
+        if self._extra is None:
+            raise KeyError(field)
+        return self._extra[field]
+
+    def __setitem__(self, field, value):
+        if field in self.FIELDS:
+            if field in self.SHARED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, field, value)
+        else:
+            # Fields the record type does not know about are kept so nothing is lost on the next write
+            if self._extra is None:
+                self._extra = {}
+            self._extra[field] = value
+
+    def __delitem__(self, field):
+        if field in self.FIELDS:
+            try:
+                delattr(self, field)
+            except AttributeError:
+                raise KeyError(field) from None
+        elif self._extra is None:
+            raise KeyError(field)
+        else:
+            del self._extra[field]
+            if not self._extra:
+                self._extra = None
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    # Function to convert the record to a plain dict in the .dat format
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS if hasattr(self, field)}
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+
+class Book(Record):
+    __slots__ = ("title", "author", "available", "id")
+    FIELDS = __slots__
+    SHARED_FIELDS = ("author",)
+
+
+class Member(Record):
+    __slots__ = ("name", "email", "id")
+    FIELDS = __slots__
+
+
+class Borrow(Record):
+    __slots__ = ("book_id", "member_id", "borrowed_at")
+    FIELDS = __slots__
+
+
+class Reservation(Record):
+    __slots__ = ("book_id", "member_id", "reserved_at")
+    FIELDS = __slots__
+
+
+class Sequence(Record):
+    __slots__ = ("collection", "last_id")
+    FIELDS = __slots__
+
+
+# Function to encode a record for json.dumps, given as its default= hook
+def to_json(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,129 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+import availability
+import store
+from store import BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE
+
+# Worker processes used for reports, 1 computes them in this process
+REPORT_WORKERS = int(os.environ.get("LMS_REPORT_WORKERS", os.cpu_count() or 1))
+
+# Rows below which a report is computed in this process, starting workers would cost more than it saves
+PARALLEL_THRESHOLD = 100000
+
+# Partitions handed out per worker, so a slow partition does not hold up the whole report
+PARTITIONS_PER_WORKER = 4
+
+# Line formats of the reports
+BORROWED_HEADER = "{:<5} {:<30} {:<20} {:<15} {:<10}".format("ID", "Title", "Author", "Member Name", "Member ID")
+BORROWED_LINE = "{:<5} {:<30} {:<20} {:<15} {:<10}"
+RESERVED_HEADER = "{:<5} {:<30} {:<20} {:<10}".format("ID", "Title", "Author", "Available")
+RESERVED_LINE = "{:<5} {:<30} {:<20} {:<10}"
+
+# Lookup tables the partitions are joined against, inherited by forked workers or sent once to each spawned one
+_shared = {}
+
+
+# Function to receive the lookup tables in a spawned worker
+def _init_worker(shared):
+    _shared.update(shared)
+
+
+# Function to format the borrowed-book lines of a partition of (book ID, member ID) pairs
+def _borrowed_lines(pairs):
+    books, members = _shared["books"], _shared["members"]
+    lines = []
+    for book_id, member_id in pairs:
+        book = books.get(book_id)
+        member = members.get(member_id)
+        if book and member:
+            lines.append(BORROWED_LINE.format(book["id"], book["title"], book["author"], member["name"], member["id"]))
+    return lines
+
+
+# Function to format the reserved-book lines of a partition of book IDs
+def _reserved_lines(book_ids):
+    books = _shared["books"]
+    lines = []
+    for book_id in book_ids:
+        book = books.get(book_id)
+        if book:
+            lines.append(RESERVED_LINE.format(book["id"], book["title"], book["author"], "No"))
+    return lines
+
+
+# Function to run a report task over partitions of the items in a process pool, merging the results in order
+def _run(task, items, shared, workers=None):
+    workers = REPORT_WORKERS if workers is None else workers
+    _shared.update(shared)
+    try:
+        if workers <= 1 or len(items) < PARALLEL_THRESHOLD:
+            return task(items)
+
+        size = -(-len(items) // (workers * PARTITIONS_PER_WORKER))
+        partitions = [items[start:start + size] for start in range(0, len(items), size)]
+        context = multiprocessing.get_context()
+        if context.get_start_method() == "fork":
+            # Forked workers see the loaded tables without copying them
+            pool = context.Pool(workers)
+        else:
+            pool = context.Pool(workers, initializer=_init_worker, initargs=(shared,))
+        with pool:
+            return list(itertools.chain.from_iterable(pool.imap(task, partitions)))
+    finally:
+        _shared.clear()
+
+
+# Function to get the lines of the borrowed-books report
+def borrowed_books_report(workers=None):
+    pairs = [(borrow["book_id"], borrow["member_id"]) for borrow in store.iter_records(BORROWS_FILE)]
+    shared = {"books": store.lookup_table(BOOKS_FILE), "members": store.lookup_table(MEMBERS_FILE)}
+    return _run(_borrowed_lines, pairs, shared, workers)
+
+
+# Function to get the lines of the reserved-books report
+def reservation_books_report(workers=None):
+    book_ids = [reservation["book_id"] for reservation in store.iter_records(RESERVATIONS_FILE)]
+    return _run(_reserved_lines, book_ids, {"books": store.lookup_table(BOOKS_FILE)}, workers)
+
+
+# Function to get the lines of the circulation summary, counted from the maintained indexes
+def summary_report():
+    total_books, total_available_books, total_unavailable_books = availability.summary()
+    return [f"Total Books: {total_books}",
+            f"Total Available Books: {total_available_books}",
+            f"Total Unavailable Books: {total_unavailable_books}",
+            f"Total Borrows: {store.count(BORROWS_FILE)}",
+            f"Total Reservations: {store.count(RESERVATIONS_FILE)}"]
+
+
+# Main function for writing end-of-day reports
+def reports_main():
+    parser = argparse.ArgumentParser(description="Write circulation reports, using a process pool for large ones.")
+    parser.add_argument("report", choices=["borrowed", "reservations", "summary"])
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS)
+    parser.add_argument("--output", help="file to write the report to instead of the console")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.report == "borrowed":
+        lines = [BORROWED_HEADER] + borrowed_books_report(args.workers)
+    elif args.report == "reservations":
+        lines = [RESERVED_HEADER] + reservation_books_report(args.workers)
+    else:
+        lines = summary_report()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        output.writelines(line + "\n" for line in lines)
+    finally:
+        if args.output:
+            output.close()
+    print(f"Report of {len(lines)} lines in {time.perf_counter() - start:.2f} seconds.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    reports_main()
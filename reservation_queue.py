@@ -0,0 +1,74 @@
+import history
+import limits
+import outbox
+import store
+from records import Borrow
+from store import BOOKS_FILE, BORROWS_FILE, MEMBERS_FILE, RESERVATIONS_FILE
+
+
+# Function to create the empty queues: book id -> {member id: reservation}, in the order they were made
+def _create():
+    return {}
+
+
+# Function to add a reservation at the end of its book's queue
+def _add(queues, reservation):
+    queues.setdefault(reservation["book_id"], {}).setdefault(reservation["member_id"], reservation)
+
+
+# Function to take a reservation out of its book's queue
+def _remove(queues, reservation):
+    queue = queues.get(reservation["book_id"])
+    if queue is not None and queue.get(reservation["member_id"]) is reservation:
+        del queue[reservation["member_id"]]
+        if not queue:
+            del queues[reservation["book_id"]]
+
+
+store.register_index("reservation_queues", RESERVATIONS_FILE, _create, _add, _remove, cacheable=True,
+                     fields=("book_id", "member_id"))
+
+
+# Function to get the queue of a book as a member id -> reservation dict
+def _queue(book_id):
+    return store.derived_index("reservation_queues").get(book_id, {})
+
+
+# Function to list the reservations of a book, first in line first
+def queue(book_id):
+    return list(_queue(book_id).values())
+
+
+# Function to get the reservation that is next in line for a book
+def next_in_line(book_id):
+    return next(iter(_queue(book_id).values()), None)
+
+
+# Function to count the reservations waiting for a book
+def queue_length(book_id):
+    return len(_queue(book_id))
+
+
+# Function to get the 1-based place of a member in a book's queue
+def position(book_id, member_id):
+    for place, queued_member_id in enumerate(_queue(book_id), start=1):
+        if queued_member_id == member_id:
+            return place
+    return None
+
+
+# Function to lend a returned book to the first member in its queue who may borrow it, notifying them;
+# returns the fulfilled reservation, or None if nobody in line can take the book
+def fulfill_next(book_id):
+    with store.transaction():
+        for reservation in queue(book_id):
+            member_id = reservation["member_id"]
+            if (not store.exists(MEMBERS_FILE, member_id) or store.exists(BORROWS_FILE, (book_id, member_id))
+                    or limits.check_loan(member_id)):
+                continue
+            store.delete(RESERVATIONS_FILE, (book_id, member_id))
+            store.insert(BORROWS_FILE, Borrow(book_id=book_id, member_id=member_id, borrowed_at=history.now()))
+            store.update(BOOKS_FILE, book_id, {"available": False})
+            outbox.enqueue("reservation_fulfilled", book_id=book_id, member_id=member_id)
+            return reservation
+    return None
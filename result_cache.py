@@ -0,0 +1,57 @@
+import os
+from collections import OrderedDict
+
+# Search results and listing pages kept, the least recently used is dropped first; 0 turns the cache off
+RESULT_CACHE_SIZE = int(os.environ.get("LMS_RESULT_CACHE_SIZE", "256"))
+
+# Cached results by key, in order of use, with the collection versions they were computed from in the key
+_entries = OrderedDict()
+
+# Lookups answered from the cache and computed, and entries dropped to stay within the size
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+# Function to get a cached result, or None if it is not cached; keys include the versions of the data used,
+# so a change to it makes the old result unreachable and it ages out
+def get(key):
+    value = _entries.get(key)
+    if value is None:
+        _stats["misses"] += 1
+    else:
+        _stats["hits"] += 1
+        _entries.move_to_end(key)
+    return value
+
+
+# Function to cache a result
+def put(key, value):
+    if RESULT_CACHE_SIZE <= 0:
+        return
+    _entries[key] = value
+    _entries.move_to_end(key)
+    while len(_entries) > RESULT_CACHE_SIZE:
+        _entries.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+# Function to get a cached result, or compute and cache it
+def cached(key, compute):
+    value = get(key)
+    if value is None:
+        value = compute()
+        put(key, value)
+    return value
+
+
+# Function to get the hit, miss and eviction counts, and how full the cache is
+def stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return dict(_stats, entries=len(_entries), size=RESULT_CACHE_SIZE,
+                hit_rate=_stats["hits"] / lookups if lookups else 0.0)
+
+
+# Function to empty the cache and reset its counts
+def clear():
+    _entries.clear()
+    for name in _stats:
+        _stats[name] = 0
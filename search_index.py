@@ -0,0 +1,159 @@
+import bisect
+import re
+
+import result_cache
+import store
+from store import BOOKS_FILE
+
+# Pattern splitting titles, authors and queries into words
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Weight of a word by the field it appears in, title matches rank above author matches
+FIELD_WEIGHTS = {"title": 2, "author": 1}
+
+# Extra weight for a query word matching a whole word rather than its beginning
+EXACT_MATCH_BOOST = 2
+
+# Share of trigrams a misspelt query word must have in common with an indexed word to match it,
+# and the shortest query word that is matched approximately at all
+FUZZY_THRESHOLD = 0.3
+FUZZY_MIN_LENGTH = 3
+
+# Share of the best similarity a word needs to be kept, so only the closest spellings are searched for
+FUZZY_RELATIVE_THRESHOLD = 0.75
+
+
+# Function to split text into lowercase words
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+# Function to split a word into its trigrams, padded so the first and last letters count as much as the others
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+# Function to get the words of a book with the weight of the best field each appears in
+def _book_tokens(book):
+    weights = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(book.get(field, "")):
+            if weights.get(token, 0) < weight:
+                weights[token] = weight
+    return weights
+
+
+# Function to create an empty index: word -> {book id: weight}, the words in sorted order for prefix lookups,
+# and trigram -> words for finding the words closest to a misspelt one
+def _create():
+    return {"postings": {}, "tokens": [], "trigrams": {}}
+
+
+# Function to add a book to the index
+def _add(index, book):
+    for token, weight in _book_tokens(book).items():
+        postings = index["postings"].get(token)
+        if postings is None:
+            postings = index["postings"][token] = {}
+            bisect.insort(index["tokens"], token)
+            for trigram in trigrams(token):
+                index["trigrams"].setdefault(trigram, set()).add(token)
+        postings[book["id"]] = weight
+
+
+# Function to remove a book from the index
+def _remove(index, book):
+    for token in _book_tokens(book):
+        postings = index["postings"].get(token)
+        if postings is None:
+            continue
+        postings.pop(book["id"], None)
+        if not postings:
+            del index["postings"][token]
+            del index["tokens"][bisect.bisect_left(index["tokens"], token)]
+            for trigram in trigrams(token):
+                words = index["trigrams"][trigram]
+                words.discard(token)
+                if not words:
+                    del index["trigrams"][trigram]
+
+
+store.register_index("search", BOOKS_FILE, _create, _add, _remove, cacheable=True, fields=FIELD_WEIGHTS)
+
+
+# Function to list the indexed words starting with a prefix
+def _matching_tokens(index, prefix):
+    tokens = index["tokens"]
+    position = bisect.bisect_left(tokens, prefix)
+    while position < len(tokens) and tokens[position].startswith(prefix):
+        yield tokens[position]
+        position += 1
+
+
+# Function to find the indexed words similar to a misspelt one, with their trigram similarity (0 to 1)
+def _similar_tokens(index, term):
+    term_trigrams = trigrams(term)
+    shared = {}
+    for trigram in term_trigrams:
+        for token in index["trigrams"].get(trigram, ()):
+            shared[token] = shared.get(token, 0) + 1
+    similar = []
+    for token, count in shared.items():
+        # Jaccard similarity of the two sets of trigrams
+        similarity = count / (len(term_trigrams) + len(trigrams(token)) - count)
+        if similarity >= FUZZY_THRESHOLD:
+            similar.append((token, similarity))
+    if not similar:
+        return similar
+    best = max(similarity for _, similarity in similar)
+    return [(token, similarity) for token, similarity in similar if similarity >= best * FUZZY_RELATIVE_THRESHOLD]
+
+
+# Function to score the books matching one query word, falling back to similar words if none starts with it
+def _score_term(index, term):
+    matches = [(token, EXACT_MATCH_BOOST if token == term else 1) for token in _matching_tokens(index, term)]
+    if not matches and len(term) >= FUZZY_MIN_LENGTH:
+        matches = _similar_tokens(index, term)
+    scores = {}
+    for token, boost in matches:
+        for book_id, weight in index["postings"][token].items():
+            score = weight * boost
+            if scores.get(book_id, 0) < score:
+                scores[book_id] = score
+    return scores
+
+
+# Function to find books whose title or author contain every query word (a word starting with it, or failing
+# that a similarly spelt word), best first
+def _search(terms, limit):
+    if not terms:
+        books = store.records(BOOKS_FILE)
+        return books[:limit] if limit is not None else list(books)
+
+    index = store.derived_index("search")
+    scores = None
+    # Start with the rarest-looking (longest) word so the candidate set shrinks quickly
+    for term in sorted(set(terms), key=len, reverse=True):
+        term_scores = _score_term(index, term)
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = {book_id: scores[book_id] + score for book_id, score in term_scores.items() if book_id in scores}
+        if not scores:
+            return []
+
+    ranked = sorted(scores, key=lambda book_id: (-scores[book_id], book_id))
+    if limit is not None:
+        ranked = ranked[:limit]
+    books = store.lookup_table(BOOKS_FILE)
+    return [books[book_id] for book_id in ranked]
+
+
+# Function to search for books, reusing the results of the same search while no title or author has changed;
+# the books are shared with the cache and must not be modified through the returned list
+def search(keyword, limit=None):
+    terms = tuple(tokenize(keyword))
+    # Results of an empty query are every book in catalog order, which any added or deleted book changes
+    version = store.index_version("search") if terms else store.version(BOOKS_FILE)
+    return result_cache.cached(("search", terms, limit, version), lambda: _search(terms, limit))
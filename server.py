@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import availability
+import batch
+import history
+import outbox
+import paging
+import records
+import reservation_queue
+import result_cache
+import search_index
+import store
+from store import BOOKS_FILE, BORROWS_FILE, MEMBERS_FILE
+
+# Rows returned by a listing when the client does not ask for a limit, and the most it may ask for
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 1 << 20
+
+# Reason phrases of the status codes the server sends
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  409: "Conflict", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+                  500: "Internal Server Error"}
+
+# Write operations accepted by POST endpoints, applied by the single writer
+WRITE_PATHS = {
+    "/borrow": "borrow",
+    "/reserve": "reserve",
+    "/return": "return",
+    "/books/create": "create_book",
+    "/books/update": "update_book",
+    "/books/delete": "delete_book",
+    "/members/create": "create_member",
+    "/members/update": "update_member",
+    "/members/delete": "delete_member",
+}
+
+
+# Error answered to the client with an HTTP status
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Function to read a non-negative integer query parameter
+def _int_param(query, name, default=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise RequestError(400, f"Missing {name}.")
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise RequestError(400, f"Invalid {name}: {values[0]!r}.")
+    if value < 0:
+        raise RequestError(400, f"Invalid {name}: {value}.")
+    return value
+
+
+# Function to read the offset and limit of a listing request
+def _page_params(query):
+    return _int_param(query, "offset", 0), min(_int_param(query, "limit", DEFAULT_LIMIT), MAX_LIMIT)
+
+
+# Function to list one page of books
+def _list_books(query):
+    offset, limit = _page_params(query)
+    return list(paging.select(store.iter_records(BOOKS_FILE), offset, limit))
+
+
+# Function to list one page of available books
+def _list_available_books(query):
+    offset, limit = _page_params(query)
+    return list(paging.select(availability.available_books(), offset, limit))
+
+
+# Function to search for books
+def _search_books(query):
+    keyword = query.get("q", [""])[0]
+    offset, limit = _page_params(query)
+    return search_index.search(keyword, limit=offset + limit)[offset:]
+
+
+# Function to get one book
+def _get_book(query):
+    book = store.get(BOOKS_FILE, _int_param(query, "id"))
+    if book is None:
+        raise RequestError(404, "Book not found.")
+    return book
+
+
+# Function to list one page of members
+def _list_members(query):
+    offset, limit = _page_params(query)
+    return list(paging.select(store.iter_records(MEMBERS_FILE), offset, limit))
+
+
+# Function to list borrowed books with their borrower, or those of one member
+def _list_borrows(query):
+    books = store.lookup_table(BOOKS_FILE)
+    members = store.lookup_table(MEMBERS_FILE)
+    if "member_id" in query:
+        borrows = store.find(BORROWS_FILE, "member_id", _int_param(query, "member_id"))
+    else:
+        offset, limit = _page_params(query)
+        borrows = paging.select(store.iter_records(BORROWS_FILE), offset, limit)
+    return [{"book": books.get(borrow["book_id"]), "member": members.get(borrow["member_id"])}
+            for borrow in borrows]
+
+
+# Function to get the reservation queue of a book
+def _reservation_queue(query):
+    return reservation_queue.queue(_int_param(query, "book_id"))
+
+
+# Function to get the archived loans of a member or a book, optionally between two return dates
+def _borrow_history(query):
+    since, until = query.get("since", [None])[0], query.get("until", [None])[0]
+    if "member_id" in query:
+        return history.member_history(_int_param(query, "member_id"), since, until)
+    return history.book_history(_int_param(query, "book_id"), since, until)
+
+
+# Function to get the book counts
+def _summary(query):
+    total_books, total_available_books, total_unavailable_books = availability.summary()
+    return {"total": total_books, "available": total_available_books, "unavailable": total_unavailable_books}
+
+
+# Function to get the hit and miss counts of the search and listing cache
+def _cache_stats(query):
+    return result_cache.stats()
+
+
+# Read endpoints by path, answered straight from the shared in-memory store
+READ_ROUTES = {
+    "/books": _list_books,
+    "/books/available": _list_available_books,
+    "/books/search": _search_books,
+    "/book": _get_book,
+    "/members": _list_members,
+    "/borrows": _list_borrows,
+    "/reservations": _reservation_queue,
+    "/history": _borrow_history,
+    "/summary": _summary,
+    "/stats/cache": _cache_stats,
+}
+
+
+# Function to apply queued write requests in batches, one store transaction and one disk commit per batch
+async def _writer(queue):
+    while True:
+        jobs = [await queue.get()]
+        while not queue.empty():
+            jobs.append(queue.get_nowait())
+        outcomes = []
+        try:
+            with store.transaction():
+                for row, future in jobs:
+                    try:
+                        with store.savepoint():
+                            batch.OPERATIONS[row["op"]](row)
+                        outcomes.append((future, None))
+                    except ValueError as error:
+                        outcomes.append((future, str(error)))
+        except Exception as error:
+            # The whole batch was rolled back
+            for _, future in jobs:
+                if not future.done():
+                    future.set_exception(error)
+            continue
+        # One outbox write for the notifications of the whole batch
+        outbox.flush()
+        for future, message in outcomes:
+            if not future.done():
+                future.set_result(message)
+
+
+# Function to hand a write request to the writer and wait until it is committed
+async def _submit_write(queue, operation, body):
+    try:
+        row = json.loads(body or b"{}")
+    except ValueError:
+        raise RequestError(400, "Request body is not valid JSON.")
+    if not isinstance(row, dict):
+        raise RequestError(400, "Request body must be a JSON object.")
+    row["op"] = operation
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((row, future))
+    message = await future
+    if message is not None:
+        status = 404 if message.endswith("not found.") else 409
+        raise RequestError(status, message)
+    return {"status": "ok"}
+
+
+# Function to answer one request with a status and a JSON-serializable payload
+async def _dispatch(queue, method, target, body):
+    url = urlsplit(target)
+    query = parse_qs(url.query)
+    if url.path in READ_ROUTES:
+        if method != "GET":
+            raise RequestError(405, "Use GET for this endpoint.")
+        return READ_ROUTES[url.path](query)
+    if url.path in WRITE_PATHS:
+        if method != "POST":
+            raise RequestError(405, "Use POST for this endpoint.")
+        return await _submit_write(queue, WRITE_PATHS[url.path], body)
+    raise RequestError(404, f"No endpoint {url.path}.")
+
+
+# Function to send a JSON response
+async def _respond(writer, status, payload, keep_alive):
+    body = json.dumps(payload, default=records.to_json).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode() + body)
+    await writer.drain()
+
+
+# Function to read a request line and its headers, raising ValueError if a line exceeds the stream limit
+async def _read_head(reader):
+    request_line = await reader.readline()
+    headers = {}
+    if not request_line.strip():
+        return request_line, headers
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return request_line, headers
+
+
+# Function to serve the requests of one client connection
+async def _handle_connection(queue, reader, writer):
+    try:
+        while True:
+            try:
+                request_line, headers = await _read_head(reader)
+            except ValueError:
+                # readline raises ValueError once a line outgrows the StreamReader limit
+                await _respond(writer, 431, {"error": "Request line or header too large."}, False)
+                break
+            if not request_line.strip():
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                await _respond(writer, 400, {"error": "Malformed request line."}, False)
+                break
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+            try:
+                length = int(headers.get("content-length", "0") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                await _respond(writer, 400, {"error": "Invalid Content-Length."}, False)
+                break
+            if length > MAX_BODY_SIZE:
+                await _respond(writer, 413, {"error": "Request body too large."}, False)
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            try:
+                status, payload = 200, await _dispatch(queue, method.upper(), target, body)
+            except RequestError as error:
+                status, payload = error.status, {"error": str(error)}
+            except Exception as error:
+                status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+            await _respond(writer, status, payload, keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+# Function to run the server until it is interrupted
+async def serve(host, port):
+    queue = asyncio.Queue()
+    writer_task = asyncio.create_task(_writer(queue))
+    server = await asyncio.start_server(lambda reader, writer: _handle_connection(queue, reader, writer),
+                                        host, port)
+    print(f"LMS service listening on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        writer_task.cancel()
+        store.checkpoint()
+        outbox.flush()
+
+
+# Main function for the service
+def server_main():
+    parser = argparse.ArgumentParser(description="Serve the LMS operations as a local HTTP/JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Stopping LMS service...")
+
+
+if __name__ == "__main__":
+    server_main()
@@ -0,0 +1,292 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import instrumentation
+import records
+import store
+
+# Define global variable for the database file
+DATABASE_FILE = "LMS.db"
+
+# Number of change-feed rows kept per collection before older ones are trimmed
+COMPACT_THRESHOLD = 1000
+
+# Table and columns of each collection, fields not listed here are kept in the "extra" column
+TABLES = {
+    store.BOOKS_FILE: ("books", ("id", "title", "author", "available")),
+    store.MEMBERS_FILE: ("members", ("id", "name", "email")),
+    store.BORROWS_FILE: ("borrows", ("book_id", "member_id")),
+    store.RESERVATIONS_FILE: ("reservations", ("book_id", "member_id")),
+    store.SEQUENCES_FILE: ("sequences", ("collection", "last_id")),
+}
+
+# Rows fetched at a time when streaming a table
+STREAM_BATCH_SIZE = 1000
+
+# Columns stored as 0/1 that the application expects as booleans
+BOOLEAN_COLUMNS = {"available"}
+
+# Open database connection of this process, and whether its transaction recorded appends to write after commit
+_state = {"connection": None, "appended": False}
+
+
+# Function to open the database connection once per process
+def _connect():
+    if _state["connection"] is None:
+        connection = sqlite3.connect(DATABASE_FILE, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _state["connection"] = connection
+    return _state["connection"]
+
+
+# Function to create the tables and indexes if they don't exist
+def initialize():
+    connection = _connect()
+    for file_name, (table, columns) in TABLES.items():
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            f"(seq INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(columns)}, extra TEXT)")
+        key = store.PRIMARY_KEYS[file_name]
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_key ON {table} ({', '.join(key)})")
+        for field in store.GROUP_KEYS[file_name]:
+            if (field,) != key[:1]:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_{field} ON {table} ({field})")
+    # Feed of journal entries so other processes can catch up without re-reading whole tables
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS changes "
+        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, entry TEXT NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS changes_collection ON changes (collection, seq)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS trimmed (collection TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+    # Committed appends to files outside the database that are not known to be written yet
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS appends "
+        "(seq INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, start INTEGER NOT NULL, text TEXT NOT NULL)")
+
+
+# Function to run reads against one consistent view of the database
+@contextmanager
+def _read_view():
+    connection = _connect()
+    if connection.in_transaction:
+        yield connection
+        return
+    connection.execute("BEGIN")
+    try:
+        yield connection
+    finally:
+        connection.execute("COMMIT")
+
+
+# Function to turn a table row into a record
+def _row_to_record(columns, row):
+    record = {}
+    for column, value in zip(columns, row):
+        if value is None:
+            continue
+        record[column] = bool(value) if column in BOOLEAN_COLUMNS else value
+    if row[-1]:
+        record.update(json.loads(row[-1]))
+    return record
+
+
+# Function to split a record into column values and the JSON of its remaining fields
+def _record_to_row(columns, record):
+    extra = {field: value for field, value in record.items() if field not in columns}
+    return [record.get(column) for column in columns] + [json.dumps(extra) if extra else None]
+
+
+# Function to build the WHERE clause matching a record key
+def _key_clause(file_name, key):
+    fields = store.PRIMARY_KEYS[file_name]
+    values = list(key) if isinstance(key, (list, tuple)) else [key]
+    return " AND ".join(f"{field} = ?" for field in fields), values
+
+
+# Function to get the trimmed position of a collection's change feed
+def _trimmed_seq(connection, file_name):
+    row = connection.execute("SELECT seq FROM trimmed WHERE collection = ?", (file_name,)).fetchone()
+    return row[0] if row else 0
+
+
+# Function to get the newest position ever handed out by the change feed, trimmed rows included
+def _latest_seq(connection):
+    row = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    return row[0] if row else 0
+
+
+# Function to read a whole collection from its table
+@instrumentation.timed()
+def read_collection(file_name):
+    table, columns = TABLES[file_name]
+    with _read_view() as connection:
+        rows = connection.execute(f"SELECT {', '.join(columns)}, extra FROM {table} ORDER BY seq").fetchall()
+        seq = _latest_seq(connection)
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+    records = [_row_to_record(columns, row) for row in rows]
+    return records, {"seq": seq, "data_version": data_version, "entries": 0}
+
+
+# Function to stream the records of a collection in batches, without holding a transaction open
+def iter_collection(file_name):
+    table, columns = TABLES[file_name]
+    connection = _connect()
+    last_seq = 0
+    while True:
+        rows = connection.execute(
+            f"SELECT seq, {', '.join(columns)}, extra FROM {table} WHERE seq > ? ORDER BY seq LIMIT ?",
+            (last_seq, STREAM_BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield _row_to_record(columns, row[1:])
+        last_seq = rows[-1][0]
+
+
+# Function to read changes committed by other processes since the given position, or None to re-read the table
+@instrumentation.timed()
+def read_changes(file_name, position):
+    connection = _connect()
+    data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == position["data_version"]:
+        return []
+    with _read_view() as connection:
+        if _trimmed_seq(connection, file_name) > position["seq"]:
+            return None
+        rows = connection.execute(
+            "SELECT seq, entry FROM changes WHERE collection = ? AND seq > ? ORDER BY seq",
+            (file_name, position["seq"])).fetchall()
+        position["seq"] = max([position["seq"]] + [row[0] for row in rows])
+    position["data_version"] = data_version
+    position["entries"] += len(rows)
+    instrumentation.add_bytes_read(sum(len(row[1]) for row in rows))
+    start = time.perf_counter()
+    entries = [json.loads(row[1]) for row in rows]
+    instrumentation.add_parse_time(time.perf_counter() - start)
+    return entries
+
+
+# Function to get a copy of a position that another process can resume from, data_version is per connection
+def portable_position(position):
+    return dict(position, data_version=None)
+
+
+# Function to apply one journal entry to the tables
+def _execute_entry(connection, file_name, entry):
+    table, columns = TABLES[file_name]
+    op = entry["op"]
+    if op == "insert":
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        connection.execute(f"INSERT INTO {table} ({', '.join(columns)}, extra) VALUES ({placeholders})",
+                           _record_to_row(columns, entry["record"]))
+    elif op in ("update", "delete"):
+        clause, values = _key_clause(file_name, entry["key"])
+        row = connection.execute(
+            f"SELECT seq, {', '.join(columns)}, extra FROM {table} WHERE {clause} ORDER BY seq LIMIT 1",
+            values).fetchone()
+        if row is None:
+            return
+        if op == "delete":
+            connection.execute(f"DELETE FROM {table} WHERE seq = ?", (row[0],))
+            return
+        record = _row_to_record(columns, row[1:])
+        record.update(entry["changes"])
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        connection.execute(f"UPDATE {table} SET {assignments}, extra = ? WHERE seq = ?",
+                           _record_to_row(columns, record) + [row[0]])
+    elif op == "delete_where":
+        connection.execute(f"DELETE FROM {table} WHERE {entry['field']} = ?", (entry["value"],))
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+
+
+# Function to write the mutations of a transaction, given as (collection, entries) pairs, and record the
+# (path, text) appends to files outside the database that commit with them
+@instrumentation.timed()
+def write(changes, appends=()):
+    connection = _connect()
+    sizes = {}
+    for path, text in appends:
+        if path not in sizes:
+            sizes[path] = os.path.getsize(path) if os.path.exists(path) else 0
+        connection.execute("INSERT INTO appends (path, start, text) VALUES (?, ?, ?)", (path, sizes[path], text))
+        sizes[path] += len(text.encode())
+        _state["appended"] = True
+    for collection, entries in changes:
+        file_name = collection["file_name"]
+        for entry in entries:
+            _execute_entry(connection, file_name, entry)
+            cursor = connection.execute("INSERT INTO changes (collection, entry) VALUES (?, ?)",
+                                        (file_name, json.dumps(entry, separators=(",", ":"), default=records.to_json)))
+            collection["position"]["seq"] = cursor.lastrowid
+        collection["position"]["entries"] += len(entries)
+        if collection["position"]["entries"] >= COMPACT_THRESHOLD:
+            checkpoint(collection)
+
+
+# Function to mark the change feed of a collection as trimmed up to a position
+def _trim(connection, file_name, seq):
+    connection.execute("DELETE FROM changes WHERE collection = ? AND seq <= ?", (file_name, seq))
+    connection.execute("INSERT OR REPLACE INTO trimmed (collection, seq) VALUES (?, ?)", (file_name, seq))
+
+
+# Function to trim the change feed of a collection, processes further behind re-read the table
+@instrumentation.timed()
+def checkpoint(collection):
+    if collection["position"]["entries"]:
+        _trim(_connect(), collection["file_name"], collection["position"]["seq"])
+        collection["position"]["entries"] = 0
+
+
+# Function to replace the whole contents of a collection's table
+@instrumentation.timed()
+def write_collection(file_name, records):
+    table, columns = TABLES[file_name]
+    connection = _connect()
+    connection.execute(f"DELETE FROM {table}")
+    placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+    connection.executemany(f"INSERT INTO {table} ({', '.join(columns)}, extra) VALUES ({placeholders})",
+                           (_record_to_row(columns, record) for record in records))
+    # Move the feed past every position handed out so far, forcing other processes to re-read the table
+    seq = connection.execute("INSERT INTO changes (collection, entry) VALUES (?, ?)", (file_name, "{}")).lastrowid
+    _trim(connection, file_name, seq)
+    data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+    return {"seq": seq, "data_version": data_version, "entries": 0}
+
+
+# Function to write the committed appends, from where each one started so one that was partly written by a
+# process that crashed is written again rather than twice, and forget them
+def _recover(connection):
+    rows = connection.execute("SELECT seq, path, start, text FROM appends ORDER BY seq").fetchall()
+    for seq, path, start, text in rows:
+        store.write_at(path, start, text)
+    if rows:
+        connection.execute("DELETE FROM appends WHERE seq <= ?", (rows[-1][0],))
+
+
+# Function to start a write transaction, which takes the database write lock
+@instrumentation.timed()
+def begin():
+    connection = _connect()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        _recover(connection)
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+
+# Function to commit or roll back the write transaction
+@instrumentation.timed()
+def end(token, committed):
+    connection = _connect()
+    connection.execute("COMMIT" if committed else "ROLLBACK")
+    appended, _state["appended"] = _state["appended"], False
+    if committed and appended:
+        # The files can only be written once the commit is durable, under the write lock again
+        begin()
+        connection.execute("COMMIT")
@@ -1,51 +1,61 @@
-import json
-
-# Define global variables for data files
-BOOKS_FILE = "Books.dat"
-BORROWS_FILE = "Borrows.dat"
-RESERVATIONS_FILE = "Reservations.dat"
-MEMBERS_FILE = "Members.dat"
-
-# Initialize data files with empty lists if they don't exist
-for file in [BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE]:
-    try:
-        with open(file, "r") as f:
-            pass
-    except FileNotFoundError:
-        with open(file, "w") as f:
-            json.dump([], f)
+import itertools
+from datetime import datetime
+
+import availability
+import history
+import instrumentation
+import limits
+import paging
+import reports
+import reservation_queue
+import search_index
+import store
+from records import Book, Borrow, Member, Reservation
+from store import BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE
 
 
 # Function to read data from a file
+@instrumentation.timed()
 def read_data(file_name):
-    with open(file_name, "r") as file:
-        data = json.load(file)
-    return data
+    return store.records(file_name)
 
 
 # Function to write data to a file
+@instrumentation.timed()
 def write_data(data, file_name):
-    with open(file_name, "w") as file:
-        json.dump(data, file)
+    store.replace(file_name, data)
+
+
+# Function to get the cache key of a book listing, or None to stream the catalog rather than load it
+def _listing_key(name):
+    version = store.loaded_version(BOOKS_FILE)
+    return None if version is None else (name, version)
+
 
+# Function to format a book as a row of the book listings
+def _book_row(book):
+    return "{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"],
+                                               "Yes" if book["available"] else "No")
 
-# Function to list all books
-def list_all_books():
-    books = read_data(BOOKS_FILE)
-    if books:
+
+# Function to list all books, reusing pages formatted earlier while no book has changed
+@instrumentation.timed()
+def list_all_books(offset=0, limit=None):
+    lines = paging.cached_lines(_listing_key("staff.books"), lambda: store.iter_records(BOOKS_FILE),
+                                _book_row, offset, limit)
+    first_line = next(lines, None)
+    if first_line is not None:
         print("All Books:")
         print("{:<5} {:<30} {:<20} {:<10}".format("ID", "Title", "Author", "Available"))
-        for book in books:
-            available_status = "Yes" if book["available"] else "No"
-            print("{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"], available_status))
+        paging.print_lines(itertools.chain([first_line], lines), limit)
     else:
         print("No books found.")
 
 
 # Function to search for books
+@instrumentation.timed()
 def search_books(keyword):
-    books = read_data(BOOKS_FILE)
-    found_books = [book for book in books if keyword.lower() in book["title"].lower()]
+    found_books = search_index.search(keyword)
     if found_books:
         print("Found Books:")
         for book in found_books:
@@ -54,101 +64,107 @@ def search_books(keyword):
         print("No books found.")
 
 
-# Function to display list of available books
-def display_available_books():
-    books = read_data(BOOKS_FILE)
-    available_books = [book for book in books if book["available"]]
-    if available_books:
+# Function to display list of available books, reusing pages formatted earlier while no book has changed
+@instrumentation.timed()
+def display_available_books(offset=0, limit=None):
+    lines = paging.cached_lines(_listing_key("staff.available"), availability.available_books,
+                                _book_info, offset, limit)
+    first_line = next(lines, None)
+    if first_line is not None:
         print("Available Books:")
-        for book in available_books:
-            print_book_info(book)
+        paging.print_lines(itertools.chain([first_line], lines), limit)
     else:
         print("No books available.")
 
 
+# Function to format book information
+def _book_info(book):
+    return f"ID: {book['id']}, Title: {book['title']}, Author: {book['author']}, Available: {book['available']}"
+
+
 # Function to print book information
 def print_book_info(book):
-    print(f"ID: {book['id']}, Title: {book['title']}, Author: {book['author']}, Available: {book['available']}")
+    print(_book_info(book))
 
 
 # Function to borrow or make a reservation for a book
+@instrumentation.timed()
 def borrow_or_reserve_book(book_id, member_id):
-    books = read_data(BOOKS_FILE)
-    # Check if the book or member exists
-    if not any(book["id"] == book_id for book in books):
-        print("Book not found.")
-        return False
-    if not any(member["id"] == member_id for member in read_data(MEMBERS_FILE)):
-        print("Member not found.")
-        return False
-
-    for book in books:
-        if book["id"] == book_id:
-            if book["available"]:
-                book["available"] = False
-                write_data(books, BOOKS_FILE)
-
-                borrows = read_data(BORROWS_FILE)
-                borrows.append({"book_id": book_id, "member_id": member_id})
-                write_data(borrows, BORROWS_FILE)
-
-                print("Book borrowed successfully.")
-            else:
-                reservations = read_data(RESERVATIONS_FILE)
-                existing_reservation = next(
-                    (r for r in reservations if r["book_id"] == book_id and r["member_id"] == member_id), None)
-                if existing_reservation:
-                    print("Reservation already made.")
-                else:
-                    choice = input("Book is currently unavailable. Do you want to make a reservation? (yes/no): ")
-                    if choice.lower() == "yes":
-                        make_reservation(book_id, member_id)
-                    else:
-                        print("No reservation made.")
+    with store.transaction():
+        # Check if the book or member exists
+        book = store.get(BOOKS_FILE, book_id)
+        if book is None:
+            print("Book not found.")
+            return False
+        if not store.exists(MEMBERS_FILE, member_id):
+            print("Member not found.")
+            return False
+
+        if book["available"]:
+            reason = limits.check_loan(member_id)
+            if reason:
+                print(reason)
+                return False
+            store.update(BOOKS_FILE, book_id, {"available": False})
+            store.insert(BORROWS_FILE, Borrow(book_id=book_id, member_id=member_id, borrowed_at=history.now()))
+            print("Book borrowed successfully.")
             return
-    print("Book not found.")
+        already_reserved = store.exists(RESERVATIONS_FILE, (book_id, member_id))
+
+    # Ask about a reservation outside the transaction so other desks are not kept waiting
+    if already_reserved:
+        print("Reservation already made.")
+    else:
+        with instrumentation.waiting():
+            choice = input("Book is currently unavailable. Do you want to make a reservation? (yes/no): ")
+        if choice.lower() == "yes":
+            make_reservation(book_id, member_id)
+        else:
+            print("No reservation made.")
 
 
 # Function to list all borrowed books
+@instrumentation.timed()
 def list_borrowed_books():
-    borrows = read_data(BORROWS_FILE)
-    books = read_data(BOOKS_FILE)
-    members = read_data(MEMBERS_FILE)
-
-    if borrows:
+    if store.count(BORROWS_FILE):
         print("Borrowed Books:")
-        print("{:<5} {:<30} {:<20} {:<15} {:<10}".format("ID", "Title", "Author", "Member Name", "Member ID"))
-        for borrow in borrows:
-            for book in books:
-                if book["id"] == borrow["book_id"]:
-                    for member in members:
-                        if member["id"] == borrow["member_id"]:
-                            print("{:<5} {:<30} {:<20} {:<15} {:<10}".format(book["id"], book["title"], book["author"],
-                                                                             member["name"], member["id"]))
-                            break
-                    break
+        print(reports.BORROWED_HEADER)
+        for line in reports.borrowed_books_report():
+            print(line)
     else:
         print("No books are currently borrowed.")
 
 
 # Function to make a reservation
+@instrumentation.timed()
 def make_reservation(book_id, member_id):
-    reservations = read_data(RESERVATIONS_FILE)
-    reservations.append({"book_id": book_id, "member_id": member_id})
-    write_data(reservations, RESERVATIONS_FILE)
+    with store.transaction():
+        # Another desk may have reserved it for the member while we were asking
+        if store.exists(RESERVATIONS_FILE, (book_id, member_id)):
+            print("Reservation already made.")
+            return
+        reason = limits.check_reservation(member_id)
+        if reason:
+            print(reason)
+            return
+        store.insert(RESERVATIONS_FILE, Reservation(book_id=book_id, member_id=member_id,
+                                                 reserved_at=datetime.now().isoformat(timespec="seconds")))
+        place = reservation_queue.queue_length(book_id)
     print("Reservation made successfully.")
+    print(f"Position in queue: {place}")
 
 
 # Function to manage book records
+@instrumentation.timed()
 def manage_books(action, book_info):
-    books = read_data(BOOKS_FILE)
     if action == "create":
-        book_info["id"] = len(books) + 1  # Assign a unique ID
-        books.append(book_info)
+        with store.transaction():
+            book_info["id"] = store.next_id(BOOKS_FILE)  # Assign a unique ID
+            store.insert(BOOKS_FILE, Book(book_info))
         print("Book created successfully.")
     elif action == "read":
         book_id = book_info["id"]
-        found_book = next((book for book in books if book["id"] == book_id), None)
+        found_book = store.get(BOOKS_FILE, book_id)
         if found_book:
             print("Book Details:")
             print(
@@ -157,33 +173,29 @@ def manage_books(action, book_info):
             print("Book not found.")
     elif action == "update":
         book_id = book_info["id"]
-        for book in books:
-            if book["id"] == book_id:
-                book.update(book_info)
-                print("Book updated successfully.")
-                break
+        if store.update(BOOKS_FILE, book_id, book_info):
+            print("Book updated successfully.")
         else:
             print("Book not found.")
     elif action == "delete":
         book_id = book_info["id"]
-        books = [book for book in books if book["id"] != book_id]
+        store.delete(BOOKS_FILE, book_id)
         print("Book deleted successfully.")
     else:
         print("Invalid action.")
 
-    write_data(books, BOOKS_FILE)
-
 
 # Function to manage member profiles
+@instrumentation.timed()
 def manage_members(action, member_info):
-    members = read_data(MEMBERS_FILE)
     if action == "create":
-        member_info["id"] = len(members) + 1  # Assign a unique ID
-        members.append(member_info)
+        with store.transaction():
+            member_info["id"] = store.next_id(MEMBERS_FILE)  # Assign a unique ID
+            store.insert(MEMBERS_FILE, Member(member_info))
         print("Member profile created successfully.")
     elif action == "read":
         member_id = member_info["id"]
-        found_member = next((member for member in members if member["id"] == member_id), None)
+        found_member = store.get(MEMBERS_FILE, member_id)
         if found_member:
             print("Member Details:")
             print(f"ID: {found_member['id']} \nName: {found_member['name']} \nEmail: {found_member['email']}")
@@ -191,103 +203,93 @@ def manage_members(action, member_info):
             print("Member not found.")
     elif action == "update":
         member_id = member_info["id"]
-        for member in members:
-            if member["id"] == member_id:
-                member.update(member_info)
-                print("Member profile updated successfully.")
-                break
+        if store.update(MEMBERS_FILE, member_id, member_info):
+            print("Member profile updated successfully.")
         else:
             print("Member not found.")
     elif action == "delete":
         member_id = member_info["id"]
-        members = [member for member in members if member["id"] != member_id]
+        store.delete(MEMBERS_FILE, member_id)
         print("Member profile deleted successfully.")
     else:
         print("Invalid action.")
 
-    write_data(members, MEMBERS_FILE)
-
 
 # Function to receive returned books
+@instrumentation.timed()
 def receive_returned_book(book_id):
-    books = read_data(BOOKS_FILE)
-    borrows = read_data(BORROWS_FILE)
-
-    for book in books:
-        if book["id"] == book_id:
-            book["available"] = True
+    with store.transaction():
+        returned = store.update(BOOKS_FILE, book_id, {"available": True})
+        if returned:
             print("Book marked as returned successfully.")
-            break
-    else:
-        print("Book not found.")
+        else:
+            print("Book not found.")
 
-    # Remove borrow record for the returned book
-    updated_borrows = [borrow for borrow in borrows if borrow["book_id"] != book_id]
-    write_data(updated_borrows, BORROWS_FILE)
+        # Move the borrow record of the returned book to the history
+        history.archive(store.delete_where(BORROWS_FILE, "book_id", book_id))
 
-    write_data(books, BOOKS_FILE)
+        # Lend the book straight to the next member waiting for it
+        reservation = reservation_queue.fulfill_next(book_id) if returned else None
+    if reservation:
+        print(f"Book lent to member ID {reservation['member_id']}, who was next in line. A notification was queued.")
 
 
 # Function to list all Members
-def list_all_members():
-    members = read_data(MEMBERS_FILE)
-    if members:
+@instrumentation.timed()
+def list_all_members(offset=0, limit=None):
+    members = paging.select(store.iter_records(MEMBERS_FILE), offset, limit)
+    first_member = next(members, None)
+    if first_member is not None:
         print("All Members:")
         print("{:<5} {:<20} {:<30}".format("ID", "Name", "Email"))
-        for member in members:
-            print("{:<5} {:<20} {:<30}".format(member["id"], member["name"], member["email"]))
+        paging.print_lines(("{:<5} {:<20} {:<30}".format(member["id"], member["name"], member["email"])
+                            for member in itertools.chain([first_member], members)), limit)
     else:
         print("No members found.")
 
 
 # Function to book summary
+@instrumentation.timed()
 def book_summary():
-    books = read_data(BOOKS_FILE)
-    total_books = len(books)
-    total_available_books = sum(book["available"] for book in books)
-    total_unavailable_books = total_books - total_available_books
+    total_books, total_available_books, total_unavailable_books = availability.summary()
 
     print("Book Summary:")
     print(f"Total Books: {total_books}")
     print(f"Total Available Books: {total_available_books}")
     print(f"Total Unavailable Books: {total_unavailable_books}")
     # Display reservation queue for a specific book
-    book_id = int(input("Enter book ID to view reservation queue (or enter 0 to skip): "))
+    with instrumentation.waiting():
+        book_id = int(input("Enter book ID to view reservation queue (or enter 0 to skip): "))
     if book_id != 0:
-        reservations = read_data(RESERVATIONS_FILE)
-        reservation_queue = [reservation for reservation in reservations if reservation["book_id"] == book_id]
-        if reservation_queue:
+        queue = reservation_queue.queue(book_id)
+        if queue:
+            members = store.lookup_table(MEMBERS_FILE)
             print(f"Reservation Queue for Book ID {book_id}:")
-            print("{:<10} {:<20} {:<30}".format("Member ID", "Name", "Email"))
-            for reservation in reservation_queue:
+            print("{:<10} {:<10} {:<20} {:<30} {:<20}".format("Position", "Member ID", "Name", "Email", "Reserved At"))
+            for place, reservation in enumerate(queue, start=1):
                 member_id = reservation["member_id"]
-                member = next((member for member in read_data(MEMBERS_FILE) if member["id"] == member_id), None)
+                reserved_at = reservation.get("reserved_at", "-")
+                member = members.get(member_id)
                 if member:
-                    print("{:<10} {:<20} {:<30}".format(member_id, member["name"], member["email"]))
+                    print("{:<10} {:<10} {:<20} {:<30} {:<20}".format(place, member_id, member["name"],
+                                                                      member["email"], reserved_at))
                 else:
-                    print("{:<10} {:<20} {:<30}".format(member_id, "Not found", "Not found"))
+                    print("{:<10} {:<10} {:<20} {:<30} {:<20}".format(place, member_id, "Not found", "Not found",
+                                                                      reserved_at))
         else:
             print("No reservations found for this book.")
 
 
 # Function to list all reservation
+@instrumentation.timed()
 def list_all_reservation_books():
-    reservations = read_data(RESERVATIONS_FILE)
-    books = read_data(BOOKS_FILE)
-
-    if reservations:
-        reserved_books = []
-        for reservation in reservations:
-            for book in books:
-                if book["id"] == reservation["book_id"]:
-                    reserved_books.append(book)
-                    break
-
-        if reserved_books:
+    if store.count(RESERVATIONS_FILE):
+        reserved_lines = reports.reservation_books_report()
+        if reserved_lines:
             print("All Reservation Books:")
-            print("{:<5} {:<30} {:<20} {:<10}".format("ID", "Title", "Author", "Available"))
-            for book in reserved_books:
-                print("{:<5} {:<30} {:<20} {:<10}".format(book["id"], book["title"], book["author"], "No"))
+            print(reports.RESERVED_HEADER)
+            for line in reserved_lines:
+                print(line)
         else:
             print("No reservation books found.")
     else:
@@ -295,55 +297,68 @@ def list_all_reservation_books():
 
 
 # Function to reservation to borrow
+@instrumentation.timed()
 def convert_reservation_to_borrow(book_id, member_id):
-    # Check if the book is available
-    books = read_data(BOOKS_FILE)
-    book = next((book for book in books if book["id"] == book_id), None)
-    if book is None:
-        print("Book not found.")
-        return
-
-    if not book["available"]:
-        print("Book is not available for borrowing.")
-        return
-
-    # Check if the member has already borrowed the same book
-    borrows = read_data(BORROWS_FILE)
-    if any(borrow["book_id"] == book_id and borrow["member_id"] == member_id for borrow in borrows):
-        print("You have already borrowed this book.")
-        return
+    with store.transaction():
+        # Check if the book is available
+        book = store.get(BOOKS_FILE, book_id)
+        if book is None:
+            print("Book not found.")
+            return
 
-    # Remove the reservation record
-    reservations = read_data(RESERVATIONS_FILE)
-    reservations = [reservation for reservation in reservations if
-                    reservation["book_id"] != book_id or reservation["member_id"] != member_id]
-    write_data(reservations, RESERVATIONS_FILE)
+        if not book["available"]:
+            print("Book is not available for borrowing.")
+            return
 
-    # Add a new borrow record
-    borrow_record = {"book_id": book_id, "member_id": member_id}
-    borrows.append(borrow_record)
-    write_data(borrows, BORROWS_FILE)
+        # Check if the member has already borrowed the same book
+        if store.exists(BORROWS_FILE, (book_id, member_id)):
+            print("You have already borrowed this book.")
+            return
+        reason = limits.check_loan(member_id)
+        if reason:
+            print(reason)
+            return
+
+        # Remove the reservation record
+        store.delete(RESERVATIONS_FILE, (book_id, member_id))
 
-    # Update the book availability
-    book["available"] = False
-    write_data(books, BOOKS_FILE)
+        # Add a new borrow record
+        borrow_record = Borrow(book_id=book_id, member_id=member_id, borrowed_at=history.now())
+        store.insert(BORROWS_FILE, borrow_record)
+
+        # Update the book availability
+        store.update(BOOKS_FILE, book_id, {"available": False})
 
     print("Book borrowed successfully.")
 
 
 # Function to delete reservation
+@instrumentation.timed()
 def delete_reservation(book_id, member_id):
     # Remove the reservation record
-    reservations = read_data(RESERVATIONS_FILE)
-    updated_reservations = [reservation for reservation in reservations if
-                            reservation["book_id"] != book_id or reservation["member_id"] != member_id]
-    if len(reservations) == len(updated_reservations):
+    if store.delete(RESERVATIONS_FILE, (book_id, member_id)) is None:
         print("Reservation not found.")
     else:
-        write_data(updated_reservations, RESERVATIONS_FILE)
         print("Reservation deleted successfully.")
 
 
+# Function to show the borrow history of a member or a book
+@instrumentation.timed()
+def show_borrow_history(kind, key):
+    loans = history.member_history(key) if kind == "member" else history.book_history(key)
+    if loans:
+        books = store.lookup_table(BOOKS_FILE)
+        print(f"Borrow History for {kind.capitalize()} ID {key}:")
+        print("{:<5} {:<30} {:<10} {:<20} {:<20}".format("ID", "Title", "Member ID", "Borrowed At", "Returned At"))
+        for loan in loans:
+            book = books.get(loan["book_id"])
+            print("{:<5} {:<30} {:<10} {:<20} {:<20}".format(loan["book_id"], book["title"] if book else "Not found",
+                                                             loan["member_id"], loan["borrowed_at"] or "-",
+                                                             loan["returned_at"]))
+    else:
+        print("No borrow history found.")
+
+
 # Main function for customer application
 def customer_main():
     print("Welcome to LMS STAFF Application")
@@ -368,7 +383,8 @@ def customer_main():
             ("11.", "Reservation to Borrowed books"),
             ("12.", "Delete Reservation"),
             ("13.", "View book summary"),
-            ("14.", "Exit")
+            ("14.", "Borrow history"),
+            ("15.", "Exit")
         ]
         for option in options:
             print("{:<5} {:<25}".format(option[0], option[1]))
@@ -461,7 +477,19 @@ def customer_main():
             book_summary()
 
         elif choice == "14":
+            kind = input("Show history for (member/book): ").strip().lower()
+            if kind not in ("member", "book"):
+                print("Invalid choice.")
+                continue
+            key = int(input(f"Enter {kind} ID: "))
+            print("******------******")
+            show_borrow_history(kind, key)
+
+        elif choice == "15":
             print("Exiting Customer Application...")
+            store.checkpoint()
+            store.save_cache()
+            instrumentation.finish()
             break
 
         else:
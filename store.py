@@ -0,0 +1,638 @@
+import gc
+import importlib
+import itertools
+import os
+import pickle
+import time
+from contextlib import contextmanager
+
+import records as record_types
+
+# Define global variables for data files
+BOOKS_FILE = "Books.dat"
+BORROWS_FILE = "Borrows.dat"
+RESERVATIONS_FILE = "Reservations.dat"
+MEMBERS_FILE = "Members.dat"
+SEQUENCES_FILE = "Sequences.dat"
+COLLECTIONS = [BOOKS_FILE, BORROWS_FILE, RESERVATIONS_FILE, MEMBERS_FILE, SEQUENCES_FILE]
+
+# Fields forming the unique lookup key of each collection
+PRIMARY_KEYS = {
+    BOOKS_FILE: ("id",),
+    MEMBERS_FILE: ("id",),
+    BORROWS_FILE: ("book_id", "member_id"),
+    RESERVATIONS_FILE: ("book_id", "member_id"),
+    SEQUENCES_FILE: ("collection",),
+}
+
+# Fields with a secondary (one-to-many) index, e.g. all borrows of a book
+GROUP_KEYS = {
+    BOOKS_FILE: (),
+    MEMBERS_FILE: (),
+    BORROWS_FILE: ("book_id", "member_id"),
+    RESERVATIONS_FILE: ("book_id", "member_id"),
+    SEQUENCES_FILE: (),
+}
+
+# Slotted record type each collection is held in
+RECORD_TYPES = {
+    BOOKS_FILE: record_types.Book,
+    MEMBERS_FILE: record_types.Member,
+    BORROWS_FILE: record_types.Borrow,
+    RESERVATIONS_FILE: record_types.Reservation,
+    SEQUENCES_FILE: record_types.Sequence,
+}
+
+# Storage backends by name, "json" keeps the .dat files and "sqlite" uses a database
+BACKENDS = {
+    "json": "json_backend",
+    "sqlite": "sqlite_backend",
+}
+STORAGE_BACKEND = os.environ.get("LMS_BACKEND", "json")
+
+# Seconds a loaded collection is trusted outside a transaction before storage is checked again for other
+# processes' changes, so one desk action checks each file once; 0 checks on every access
+POLL_INTERVAL = float(os.environ.get("LMS_POLL_INTERVAL", "0.1"))
+
+# File the loaded collections are saved to on exit and restored from on first use, so a new process starts warm
+# and only catches up on what changed since; unset to always load from storage
+CACHE_FILE = os.environ.get("LMS_CACHE", "")
+
+# Format of the cache file, a cache of another format is ignored
+CACHE_VERSION = 2
+
+# Raised when a record is inserted with the key of a record that is already stored
+class DuplicateKeyError(ValueError):
+    pass
+
+
+# Loaded collections keyed by file name
+_collections = {}
+
+# Extra indexes kept in step with a collection, registered by other modules
+_index_types = {}
+
+# State of the transaction this process is running, if any
+_transaction = {"depth": 0, "token": None, "pending": [], "undo": [], "serial": 0, "on_commit": [], "appends": []}
+
+# Marks a field that a record did not have before an update
+_MISSING = object()
+
+# Backend module in use
+_backend = {"module": None}
+
+# Source of collection versions, never reused in this process so a version names one state of one collection
+_versions = itertools.count(1)
+
+
+# Function to switch the storage backend, dropping everything loaded from the old one
+def use_backend(name):
+    if _transaction["depth"]:
+        raise RuntimeError("Cannot switch storage backend inside a transaction.")
+    module = importlib.import_module(BACKENDS[name])
+    module.initialize()
+    _backend["module"] = module
+    _collections.clear()
+    _collections.update(_read_cache(name))
+
+
+# Function to get the storage backend in use, initializing it on first use rather than when the application starts
+def backend():
+    if _backend["module"] is None:
+        use_backend(STORAGE_BACKEND)
+    return _backend["module"]
+
+
+# Function to turn a record read from storage or given by a caller into the record type of its collection
+def make_record(file_name, data):
+    record_type = RECORD_TYPES[file_name]
+    return data if type(data) is record_type else record_type(data)
+
+
+# Function to build the lookup key of a record
+def record_key(file_name, record):
+    fields = PRIMARY_KEYS[file_name]
+    if len(fields) == 1:
+        return record[fields[0]]
+    return tuple(record[field] for field in fields)
+
+
+# Function to check whether an extra index must follow a change to the given fields, None meaning any field
+def _index_affected(name, changed):
+    fields = _index_types[name]["fields"]
+    return changed is None or fields is None or not fields.isdisjoint(changed)
+
+
+# Function to add a record to the indexes of a collection, skipping extra indexes that ignore the changed fields
+def _index_record(collection, record, changed=None):
+    file_name = collection["file_name"]
+    if collection["primary"].setdefault(record_key(file_name, record), record) is not record:
+        collection["duplicates"] += 1
+    for field in GROUP_KEYS[file_name]:
+        # Each group is keyed by object id like the rows, so one record is removed in constant time
+        collection["groups"][field].setdefault(record[field], {})[id(record)] = record
+    for name, index in collection["derived"].items():
+        if _index_affected(name, changed):
+            _index_types[name]["add"](index, record)
+            collection["index_versions"][name] = next(_versions)
+
+
+# Function to remove a record from the indexes of a collection, skipping extra indexes that ignore the changed fields
+def _unindex_record(collection, record, changed=None):
+    file_name = collection["file_name"]
+    key = record_key(file_name, record)
+    if collection["primary"].get(key) is not record:
+        collection["duplicates"] -= 1
+    else:
+        del collection["primary"][key]
+        # Promote a duplicate with the same key, if the file contains one
+        if collection["duplicates"]:
+            for other in collection["rows"].values():
+                if other is not record and record_key(file_name, other) == key:
+                    collection["primary"][key] = other
+                    collection["duplicates"] -= 1
+                    break
+    for field in GROUP_KEYS[file_name]:
+        group = collection["groups"][field].get(record[field])
+        if group is not None:
+            group.pop(id(record), None)
+            if not group:
+                del collection["groups"][field][record[field]]
+    for name, index in collection["derived"].items():
+        if _index_affected(name, changed):
+            _index_types[name]["remove"](index, record)
+            collection["index_versions"][name] = next(_versions)
+
+
+# Function to build a collection with fresh indexes from a list of records
+def _build_collection(file_name, records, position):
+    # Convert in place so each record read from storage can be freed as soon as its replacement is built
+    for row, record in enumerate(records):
+        records[row] = make_record(file_name, record)
+    collection = {
+        "file_name": file_name,
+        "position": position,
+        # Records in file order, keyed by object id so one can be removed without a scan
+        "rows": {id(record): record for record in records},
+        "primary": {},
+        "duplicates": 0,
+        "groups": {field: {} for field in GROUP_KEYS[file_name]},
+        "derived": {},
+        "version": next(_versions),
+        "index_versions": {},
+    }
+    _mark_polled(collection)
+    for record in records:
+        _index_record(collection, record)
+    return collection
+
+
+# Function to register an extra index, built on first use and updated with every change to the collection;
+# cacheable indexes are saved in the cache file, which needs them to hold no object ids, and an index listing
+# the fields it reads is left alone by updates that change none of them
+def register_index(name, file_name, create, add, remove, cacheable=False, fields=None):
+    _index_types[name] = {"file_name": file_name, "create": create, "add": add, "remove": remove,
+                          "cacheable": cacheable, "fields": None if fields is None else frozenset(fields)}
+
+
+# Function to get an extra index of a collection, building it if needed
+def derived_index(name):
+    index_type = _index_types[name]
+    collection = load(index_type["file_name"])
+    index = collection["derived"].get(name)
+    if index is None:
+        index = index_type["create"]()
+        for record in collection["rows"].values():
+            index_type["add"](index, record)
+        collection["derived"][name] = index
+        collection["index_versions"][name] = next(_versions)
+    return index
+
+
+# Function to get the version of an extra index, which changes whenever the index does
+def index_version(name):
+    derived_index(name)
+    return _collections[_index_types[name]["file_name"]]["index_versions"][name]
+
+
+# Function to turn a key read back from JSON into the form used by the indexes
+def _decode_key(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+# Function to apply one mutation entry to a loaded collection
+def _apply(collection, entry, replaying=False):
+    file_name = collection["file_name"]
+    collection["version"] = next(_versions)
+    op = entry["op"]
+    if op == "insert":
+        record = make_record(file_name, entry["record"])
+        existing = collection["primary"].get(record_key(file_name, record))
+        if existing is not None:
+            # Replaying a log that was already folded into the snapshot must not duplicate records
+            if replaying:
+                return existing
+            raise DuplicateKeyError(f"{file_name} already has a record with key {record_key(file_name, record)!r}.")
+        collection["rows"][id(record)] = record
+        _index_record(collection, record)
+        return record
+    if op == "update":
+        record = collection["primary"].get(_decode_key(entry["key"]))
+        if record is None:
+            return None
+        _unindex_record(collection, record, entry["changes"].keys())
+        record.update(entry["changes"])
+        _index_record(collection, record, entry["changes"].keys())
+        return record
+    if op == "delete":
+        record = collection["primary"].get(_decode_key(entry["key"]))
+        if record is None:
+            return None
+        _unindex_record(collection, record)
+        del collection["rows"][id(record)]
+        return record
+    if op == "delete_where":
+        field, value = entry["field"], entry["value"]
+        removed = list(collection["groups"][field].get(value, {}).values())
+        if not removed:
+            return []
+        for record in removed:
+            _unindex_record(collection, record)
+            del collection["rows"][id(record)]
+        return removed
+    raise ValueError(f"Unknown journal operation: {op}")
+
+
+# Function to remember when a collection was last brought up to date with storage
+def _mark_polled(collection):
+    collection["polled_at"] = time.monotonic()
+    collection["polled_in"] = _transaction["serial"] if _transaction["depth"] else None
+
+
+# Function to check whether a loaded collection must be checked for other processes' changes before use
+def _poll_due(collection):
+    if _transaction["depth"]:
+        # Under the write lock every transaction starts from what is stored
+        return collection["polled_in"] != _transaction["serial"]
+    return time.monotonic() - collection["polled_at"] >= POLL_INTERVAL
+
+
+# Function to load a collection, reading only the changes made since it was last loaded
+def load(file_name):
+    storage = backend()
+    collection = _collections.get(file_name)
+    if collection is not None and not _poll_due(collection):
+        return collection
+    entries = None
+    if collection is not None:
+        entries = storage.read_changes(file_name, collection["position"])
+        _mark_polled(collection)
+    if entries is None:
+        records, position = storage.read_collection(file_name)
+        collection = _build_collection(file_name, records, position)
+        _collections[file_name] = collection
+        entries = storage.read_changes(file_name, position)
+    for entry in entries:
+        _apply(collection, entry, replaying=True)
+    return collection
+
+
+# Function to fold recorded changes of every loaded collection into its main storage, e.g. before exiting
+def checkpoint():
+    with transaction():
+        for file_name in list(_collections):
+            backend().checkpoint(load(file_name))
+
+
+# Function to group pending mutations by collection, keeping their order
+def _group_entries(pending):
+    grouped = {}
+    for file_name, entry in pending:
+        grouped.setdefault(file_name, []).append(entry)
+    return grouped
+
+
+# Function to run a block of reads and writes as one locked, all-or-nothing transaction
+@contextmanager
+def transaction():
+    if _transaction["depth"]:
+        _transaction["depth"] += 1
+        try:
+            yield
+        finally:
+            _transaction["depth"] -= 1
+        return
+
+    storage = backend()
+    _transaction["token"] = storage.begin()
+    _transaction["depth"] = 1
+    _transaction["pending"] = []
+    _transaction["undo"] = []
+    _transaction["appends"] = []
+    _transaction["serial"] += 1
+    committed = False
+    try:
+        yield
+        grouped = _group_entries(_transaction["pending"])
+        if grouped or _transaction["appends"]:
+            storage.write([(_collections[file_name], entries) for file_name, entries in grouped.items()],
+                          _transaction["appends"])
+        committed = True
+    except BaseException:
+        # Drop the in-memory changes, the next access reloads what is stored
+        for file_name in _group_entries(_transaction["pending"]):
+            _collections.pop(file_name, None)
+        raise
+    finally:
+        callbacks = _transaction["on_commit"]
+        _transaction["depth"] = 0
+        _transaction["pending"] = []
+        _transaction["undo"] = []
+        _transaction["on_commit"] = []
+        _transaction["appends"] = []
+        storage.end(_transaction["token"], committed)
+        _transaction["token"] = None
+    # A failing callback must not keep the others from running, its error is raised once they have all run
+    error = None
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as callback_error:
+            error = error or callback_error
+    if error is not None:
+        raise error
+
+
+# Function to write text at a byte offset of a file, cutting off whatever follows it, so that an append replayed
+# after a crash replaces its own partial or complete first attempt instead of being written twice
+def write_at(path, offset, text):
+    with open(path, "ab") as file:
+        if os.fstat(file.fileno()).st_size > offset:
+            file.truncate(offset)
+        file.write(text.encode())
+        file.flush()
+        os.fsync(file.fileno())
+
+
+# Function to append text to a file as part of the current transaction, e.g. lines of a log kept outside the
+# store: the text is written if and only if the transaction commits, even if the process crashes in between
+def append_on_commit(path, text):
+    with transaction():
+        _transaction["appends"].append((path, text))
+
+
+# Function to run a callback once the current transaction is committed, e.g. to write files kept outside the store
+def on_commit(callback):
+    if _transaction["depth"]:
+        _transaction["on_commit"].append(callback)
+    else:
+        callback()
+
+
+# Function to run a block of a transaction that is undone on its own if it fails, e.g. one row of a batch:
+# its in-memory changes are reverted and its pending entries, commit callbacks and appends dropped, the rest is kept
+@contextmanager
+def savepoint():
+    with transaction():
+        marks = {name: len(_transaction[name]) for name in ("pending", "undo", "on_commit", "appends")}
+        try:
+            yield
+        except BaseException:
+            for collection, entry, before, result in reversed(_transaction["undo"][marks["undo"]:]):
+                _revert(collection, entry, before, result)
+            for name, mark in marks.items():
+                del _transaction[name][mark:]
+            raise
+
+
+# Function to capture what an update will overwrite, so it can be reverted
+def _before(collection, entry):
+    if entry["op"] != "update":
+        return None
+    record = collection["primary"].get(_decode_key(entry["key"]))
+    if record is None:
+        return None
+    return {field: record.get(field, _MISSING) for field in entry["changes"]}
+
+
+# Function to undo an applied mutation in memory, given what it overwrote and what it returned
+def _revert(collection, entry, before, result):
+    op = entry["op"]
+    if op == "insert":
+        _unindex_record(collection, result)
+        del collection["rows"][id(result)]
+    elif op == "update":
+        _unindex_record(collection, result, before.keys())
+        for field, value in before.items():
+            if value is _MISSING:
+                del result[field]
+            else:
+                result[field] = value
+        _index_record(collection, result, before.keys())
+    else:
+        for record in (result if op == "delete_where" else [result]):
+            collection["rows"][id(record)] = record
+            _index_record(collection, record)
+    collection["version"] = next(_versions)
+
+
+# Function to apply a mutation to a collection as part of the current transaction
+def _mutate(file_name, entry):
+    with transaction():
+        collection = load(file_name)
+        before = _before(collection, entry)
+        result = _apply(collection, entry)
+        if result:
+            _transaction["pending"].append((file_name, entry))
+            _transaction["undo"].append((collection, entry, before, result))
+    return result
+
+
+# Function to get all records of a collection
+def records(file_name):
+    return list(load(file_name)["rows"].values())
+
+
+# Function to check whether a collection is held in memory
+def is_loaded(file_name):
+    return file_name in _collections
+
+
+# Function to iterate over the records of a collection, streaming them from storage if it is not loaded yet
+def iter_records(file_name):
+    if file_name not in _collections:
+        records = backend().iter_collection(file_name)
+        if records is not None:
+            return records
+    return iter(load(file_name)["rows"].values())
+
+
+# Function to get the version of a collection, which changes whenever any of its records do
+def version(file_name):
+    return load(file_name)["version"]
+
+
+# Function to get the version of a collection if it is held in memory, or None rather than loading it
+def loaded_version(file_name):
+    return version(file_name) if file_name in _collections else None
+
+
+# Function to count the records of a collection
+def count(file_name):
+    return len(load(file_name)["rows"])
+
+
+# Function to get the key -> record table of a collection, for joining many records in one pass
+def lookup_table(file_name):
+    return load(file_name)["primary"]
+
+
+# Function to look up a record by its key
+def get(file_name, key):
+    return load(file_name)["primary"].get(key)
+
+
+# Function to check if a record with the given key exists
+def exists(file_name, key):
+    return key in load(file_name)["primary"]
+
+
+# Function to get all records sharing a value of an indexed field
+def find(file_name, field, value):
+    return list(load(file_name)["groups"][field].get(value, {}).values())
+
+
+# Function to count the records sharing a value of an indexed field
+def count_where(file_name, field, value):
+    return len(load(file_name)["groups"][field].get(value, ()))
+
+
+# Function to add a record to a collection
+def insert(file_name, record):
+    return _mutate(file_name, {"op": "insert", "record": record})
+
+
+# Function to add many records to a collection as one batch of journal entries
+def insert_many(file_name, new_records):
+    with transaction():
+        collection = load(file_name)
+        for record in new_records:
+            entry = {"op": "insert", "record": record}
+            record = _apply(collection, entry)
+            _transaction["pending"].append((file_name, entry))
+            _transaction["undo"].append((collection, entry, None, record))
+
+
+# Function to change fields of the record with the given key
+def update(file_name, key, changes):
+    return _mutate(file_name, {"op": "update", "key": key, "changes": changes})
+
+
+# Function to remove the record with the given key
+def delete(file_name, key):
+    return _mutate(file_name, {"op": "delete", "key": key})
+
+
+# Function to remove all records sharing a value of an indexed field
+def delete_where(file_name, field, value):
+    return _mutate(file_name, {"op": "delete_where", "field": field, "value": value})
+
+
+# Function to allocate the next IDs of a collection from its stored sequence, never reusing a deleted one
+def next_ids(file_name, count):
+    with transaction():
+        sequence = get(SEQUENCES_FILE, file_name)
+        if sequence is None:
+            # First ID handed out for this collection, continue after the highest one already stored
+            last_id = max((record["id"] for record in iter_records(file_name)), default=0)
+        else:
+            last_id = sequence["last_id"]
+        taken = lookup_table(file_name)
+        new_ids = []
+        while len(new_ids) < count:
+            last_id += 1
+            # Records inserted with explicit IDs may have run ahead of the sequence
+            if last_id not in taken:
+                new_ids.append(last_id)
+        if sequence is None:
+            insert(SEQUENCES_FILE, record_types.Sequence(collection=file_name, last_id=last_id))
+        elif count:
+            update(SEQUENCES_FILE, file_name, {"last_id": last_id})
+    return new_ids
+
+
+# Function to allocate the next ID of a collection
+def next_id(file_name):
+    return next_ids(file_name, 1)[0]
+
+
+# Function to replace a whole collection
+def replace(file_name, new_records):
+    with transaction():
+        position = backend().write_collection(file_name, new_records)
+        _collections[file_name] = _build_collection(file_name, list(new_records), position)
+
+
+# Function to save the loaded collections and their cacheable indexes to the cache file
+def save_cache(path=None):
+    path = path or CACHE_FILE
+    if not path or _backend["module"] is None:
+        return
+    if _transaction["depth"]:
+        raise RuntimeError("Cannot save the cache inside a transaction.")
+    collections = {}
+    for file_name, collection in _collections.items():
+        collections[file_name] = dict(
+            collection,
+            rows=list(collection["rows"].values()),
+            groups={field: {value: list(group.values()) for value, group in groups.items()}
+                    for field, groups in collection["groups"].items()},
+            position=_backend["module"].portable_position(collection["position"]),
+            derived={index_name: index for index_name, index in collection["derived"].items()
+                     if _index_types[index_name]["cacheable"]})
+    # Each process writes its own temporary file, so processes saving at the same time do not write into one
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            pickle.dump({"version": CACHE_VERSION, "backend": _backend["module"].__name__,
+                         "collections": collections}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Function to read the collections saved in the cache file, each checked for changes in storage on first use
+def _read_cache(name):
+    if not CACHE_FILE:
+        return {}
+    # Garbage collection is paused while unpickling, it would otherwise scan the young records over and over
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        with open(CACHE_FILE, "rb") as file:
+            cache = pickle.load(file)
+        if cache.get("version") != CACHE_VERSION or cache.get("backend") != BACKENDS[name]:
+            return {}
+        collections = cache["collections"]
+        for collection in collections.values():
+            # Object ids are only meaningful in the process that saved the cache
+            collection["rows"] = {id(record): record for record in collection["rows"]}
+            collection["groups"] = {
+                field: {value: {id(record): record for record in group} for value, group in groups.items()}
+                for field, groups in collection["groups"].items()}
+            # Indexes not registered in this process would not be kept up to date
+            collection["derived"] = {index_name: index for index_name, index in collection["derived"].items()
+                                     if index_name in _index_types}
+            collection["polled_at"] = float("-inf")
+            collection["polled_in"] = None
+            collection["version"] = next(_versions)
+            collection["index_versions"] = {index_name: next(_versions) for index_name in collection["derived"]}
+    except Exception:
+        # The cache is only a shortcut: a missing, truncated, foreign or otherwise unreadable one is a miss
+        return {}
+    finally:
+        if collecting:
+            gc.enable()
+    return collections
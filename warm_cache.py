@@ -0,0 +1,35 @@
+import argparse
+import time
+
+import availability
+import reservation_queue
+import search_index
+import store
+
+# Cache file written when LMS_CACHE is not set
+DEFAULT_CACHE_FILE = "LMS.cache"
+
+
+# Function to load every collection and build its indexes, then save them as the cache file new processes start from
+def build_cache(path):
+    for file_name in store.COLLECTIONS:
+        store.load(file_name)
+    for name in ("availability", "reservation_queues", "search"):
+        store.derived_index(name)
+    store.checkpoint()
+    store.save_cache(path)
+
+
+# Main function for prebuilding the cache
+def warm_cache_main():
+    parser = argparse.ArgumentParser(description="Prebuild the cache file the applications restore their data from.")
+    parser.add_argument("path", nargs="?", default=store.CACHE_FILE or DEFAULT_CACHE_FILE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_cache(args.path)
+    print(f"Wrote {args.path} in {time.perf_counter() - start:.2f} seconds, start with LMS_CACHE={args.path} to use it.")
+
+
+if __name__ == "__main__":
+    warm_cache_main()